@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class Adjudicator():
+    """
+    Ends games that repeat positions or run too long, for Coach's self-play
+    and Arena.
+
+    A game is ended when a position (board and player to move) occurs for the
+    repetitions-th time (None disables this), or after maxMoves moves (None
+    for no limit). Positions are remembered by the hashes of their
+    stringRepresentation, in a dict per game. The result is decided by rule:
+        'draw':  a draw
+        'value': the mean value of the position for the player to move
+                 according to nnets; a win (loss) if it is at least valueMargin
+                 above (below) 0, else a draw. Without nnets it is a draw.
+    """
+
+    def __init__(self, game, maxMoves=500, repetitions=None, rule='draw', nnets=(), valueMargin=0.5):
+        if rule not in ('draw', 'value'):
+            raise ValueError(f'Unknown adjudication rule {rule}')
+        self.game = game
+        self.maxMoves = maxMoves
+        self.repetitions = repetitions
+        self.rule = rule
+        self.nnets = list(nnets) if rule == 'value' else []
+        self.valueMargin = valueMargin
+
+    @classmethod
+    def fromArgs(cls, game, args, nnets=()):
+        """
+        Returns the Adjudicator configured by args.maxMoves (default 500),
+        args.repetitions and args.adjudication (default 'draw').
+        """
+        return cls(game, maxMoves=args.get('maxMoves', 500), repetitions=args.get('repetitions'),
+                   rule=args.get('adjudication') or 'draw', nnets=nnets)
+
+    def adjudicateSteps(self, board, curPlayer, moves, seen):
+        """
+        Step generator (see MCTS.searchSteps) that checks a position of a game
+        that has not ended.
+
+        Input:
+            board, curPlayer: the position
+            moves: number of moves played so far
+            seen: dict of the game's position hashes and their counts, updated
+
+        Returns:
+            result: None if the game goes on, else its result for curPlayer
+                    (0 for a draw)
+        """
+        repeated = False
+        if self.repetitions:
+            key = hash((curPlayer, self.game.stringRepresentation(board)))
+            seen[key] = seen.get(key, 0) + 1
+            repeated = seen[key] >= self.repetitions
+        if not repeated and (self.maxMoves is None or moves < self.maxMoves):
+            return None
+        if self.rule == 'draw' or not self.nnets:
+            return 0
+
+        canonicalBoard = self.game.getCanonicalForm(board, curPlayer)
+        value = 0
+        for nnet in self.nnets:
+            _, v = yield nnet, canonicalBoard
+            value += float(np.asarray(v).reshape(-1)[0]) / len(self.nnets)
+        if value >= self.valueMargin:
+            return 1
+        if value <= -self.valueMargin:
+            return -1
+        return 0
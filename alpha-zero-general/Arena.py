@@ -1,7 +1,15 @@
+import inspect
 import logging
+import sys
 
+import numpy as np
 from tqdm import tqdm
 
+from Adjudicator import Adjudicator
+from MCTS import MCTS, runBatched, runSteps
+from SharedEvalTable import SharedCacheNNet, checkpointVersion
+from utils import processContext
+
 log = logging.getLogger(__name__)
 
 
@@ -10,14 +18,28 @@ class Arena():
     An Arena class where any 2 agents can be pit against each other.
     """
 
-    def __init__(self, player1, player2, game, display=None):
+    def __init__(self, player1, player2, game, display=None, cache=None, playerKeys=None, openingMoves=0,
+                 adjudicator=None):
         """
         Input:
             player 1,2: two functions that takes board as input, return action
+                        (or a step generator that returns the action, e.g.
+                        MCTS.bestActionSteps)
             game: Game object
             display: a function that takes board as input and prints it (e.g.
                      display in othello/OthelloGame). Is necessary for verbose
                      mode.
+            cache: optional GameCache with the results of games already
+                   played, for players that are deterministic given the
+                   start position
+            playerKeys: keys identifying player1 and player2 in the cache
+                        (e.g. hashes of their configs and weights); games of
+                        a player with key None are not cached
+            openingMoves: number of random moves every start position is
+                          advanced by, so that the games of deterministic
+                          players differ
+            adjudicator: Adjudicator ending games that repeat positions or
+                         run too long, by default a draw after 500 moves
 
         see othello/OthelloPlayers.py for an example. See pit.py for pitting
         human players/other baselines with each other.
@@ -26,6 +48,10 @@ class Arena():
         self.player2 = player2
         self.game = game
         self.display = display
+        self.cache = cache
+        self.playerKeys = playerKeys
+        self.openingMoves = openingMoves
+        self.adjudicator = adjudicator or Adjudicator(game)
 
     def playGame(self, verbose=False):
         """
@@ -37,27 +63,36 @@ class Arena():
             or
                 draw result returned from the game that is neither 1, -1, nor 0.
         """
-        players = [self.player2, None, self.player1]
-        curPlayer = 1
-        board = self.game.getInitBoard()
+        return runSteps(self.playGameSteps(self.player1, self.player2, verbose=verbose))
+
+    def playGameSteps(self, player1, player2, verbose=False, start=None):
+        """
+        Step generator version of playGame between player1 and player2, see
+        MCTS.searchSteps. The game starts from start = (board, curPlayer), by
+        default from the initial board with player1 to move.
+        """
+        players = [player2, None, player1]
+        board, curPlayer = start if start is not None else (self.game.getInitBoard(), 1)
         it = 0
-        
-        # Maximum moves per game to prevent infinite games
-        MAX_MOVES = 500
+        seen = {}  # position hashes of the adjudicator
 
         for player in players[0], players[2]:
             if hasattr(player, "startGame"):
                 player.startGame()
 
-        while self.game.getGameEnded(board, curPlayer) == 0 and it < MAX_MOVES:
+        result = self.game.getGameEnded(board, curPlayer)
+        while result == 0:
             it += 1
             if verbose:
                 assert self.display
                 print("Turn ", str(it), "Player ", str(curPlayer))
                 self.display(board)
-            action = players[curPlayer + 1](self.game.getCanonicalForm(board, curPlayer))
+            canonicalBoard = self.game.getCanonicalForm(board, curPlayer)
+            action = players[curPlayer + 1](canonicalBoard)
+            if inspect.isgenerator(action):
+                action = yield from action
 
-            valids = self.game.getValidMoves(self.game.getCanonicalForm(board, curPlayer), 1)
+            valids = self.game.getValidMoves(canonicalBoard, 1)
 
             if valids[action] == 0:
                 log.error(f'Action {action} is not valid!')
@@ -71,49 +106,271 @@ class Arena():
 
             board, curPlayer = self.game.getNextState(board, curPlayer, action)
 
+            result = self.game.getGameEnded(board, curPlayer)
+            if result == 0:
+                # repeated positions and overlong games end with the adjudicator's result
+                adjudicated = yield from self.adjudicator.adjudicateSteps(board, curPlayer, it, seen)
+                if adjudicated is not None:
+                    result = adjudicated
+                    break
+
         for player in players[0], players[2]:
             if hasattr(player, "endGame"):
                 player.endGame()
 
         if verbose:
             assert self.display
-            print("Game over: Turn ", str(it), "Result ", str(self.game.getGameEnded(board, 1)))
+            print("Game over: Turn ", str(it), "Result ", str(curPlayer * result))
             self.display(board)
-        return curPlayer * self.game.getGameEnded(board, curPlayer)
+        return curPlayer * result
+
+    def matchGameSteps(self, player1, player2, swapped, start=None, verbose=False):
+        """
+        Step generator of one game of a match: player1 against player2, with
+        player2 moving first if swapped, from start (see playGameSteps).
+
+        Returns:
+            result: the result from the perspective of player1
+        """
+        if swapped:
+            result = yield from self.playGameSteps(player2, player1, verbose=verbose, start=start)
+            return -result if abs(result) == 1 else result
+        return (yield from self.playGameSteps(player1, player2, verbose=verbose, start=start))
 
-    def playGames(self, num, verbose=False):
+    def matchGames(self, num, stopper=None):
+        """
+        Returns the games of a match of num games as (swapped, start) pairs, in
+        which player1 moves first in num/2 games and player2 (swapped) in the
+        others. With a stopper the first mover alternates, so the balance
+        holds whenever the match ends.
+
+        Without a cache and openingMoves the start is None, so every game
+        draws its own initial board. Otherwise both games of a pair share a
+        start from randomStart.
+        """
+        num = int(num / 2)
+        diversified = self.cache is not None or self.openingMoves > 0
+        starts = [self.randomStart() if diversified else None for _ in range(num)]
+        if stopper is not None:
+            return [(i % 2 == 1, starts[i // 2]) for i in range(2 * num)]
+        return [(False, start) for start in starts] + [(True, start) for start in starts]
+
+    def randomStart(self):
+        """
+        Returns a start position (board, curPlayer): the initial board after
+        openingMoves random moves, which makes games between deterministic
+        players differ beyond the game's own start positions.
+        """
+        board, curPlayer = self.game.getInitBoard(), 1
+        for _ in range(self.openingMoves):
+            if self.game.getGameEnded(board, curPlayer) != 0:
+                break
+            valids = self.game.getValidMoves(self.game.getCanonicalForm(board, curPlayer), 1)
+            board, curPlayer = self.game.getNextState(board, curPlayer, np.random.choice(np.flatnonzero(valids)))
+        return board, curPlayer
+
+    def gameKey(self, swapped, start):
+        """
+        Returns the cache key of a game of a match, or None if it is not
+        cached (no cache, or a player without a key).
+        """
+        if self.cache is None or self.playerKeys is None or None in self.playerKeys:
+            return None
+        return self.cache.key(self.playerKeys[::-1] if swapped else self.playerKeys, start)
+
+    def playMatch(self, games, play, stopper=None):
+        """
+        Plays the games of a match (see matchGames) with play, once per
+        distinct game: a game found in the cache counts right away, and games
+        with the same cache key count with the result of the one played.
+
+        Input:
+            play: function(games, finished) that plays a list of games and
+                  calls finished(j, result) whenever the j-th ends, result
+                  being from the perspective of player1. It stops playing when
+                  finished returns True.
+            stopper: see playGames
+
+        Returns:
+            oneWon: games won by player1
+            twoWon: games won by player2
+            draws:  games won by nobody
+        """
+        counts = {1: 0, -1: 0, 0: 0}  # games won by player1, player2 and nobody
+
+        def count(result, copies):
+            for _ in range(copies):
+                counts[result if abs(result) == 1 else 0] += 1
+                reason = stopper(counts[1], counts[-1], counts[0]) if stopper is not None else None
+                if reason is not None:
+                    log.info(f'Stopping after {sum(counts.values())} of {len(games)} games: {reason}')
+                    return True
+            return False
+
+        copies = {}  # indices of the games of every key, in order of the first one
+        for i, (swapped, start) in enumerate(games):
+            key = self.gameKey(swapped, start)
+            copies.setdefault(i if key is None else key, []).append(i)
+        toPlay = []  # (key, indices) of the games to play
+        for key, indices in copies.items():
+            result = self.cache.get(key) if isinstance(key, str) else None
+            if result is None:
+                toPlay.append((key, indices))
+                continue
+            swapped = games[indices[0]][0]
+            if count(-result if swapped and abs(result) == 1 else result, len(indices)):
+                return counts[1], counts[-1], counts[0]
+        if len(toPlay) < len(games):
+            log.info(f'Playing {len(toPlay)} of {len(games)} games, the others are cached or repeated')
+
+        def finished(j, result):
+            key, indices = toPlay[j]
+            if isinstance(key, str):
+                swapped = games[indices[0]][0]
+                self.cache.put(key, -result if swapped and abs(result) == 1 else result)
+            return count(result, len(indices))
+
+        play([games[indices[0]] for _, indices in toPlay], finished)
+        return counts[1], counts[-1], counts[0]
+
+    def playGames(self, num, verbose=False, stopper=None):
         """
         Plays num games in which player1 starts num/2 games and player2 starts
         num/2 games.
 
+        If a stopper is given (e.g. an SPRT), the players take turns starting,
+        so the first-mover balance holds whenever the match ends, and after
+        every game stopper(oneWon, twoWon, draws) is called. As soon as it
+        returns a reason, the match ends early and the reason is logged.
+
+        With a cache, games already played (see GameCache) are not played
+        again.
+
         Returns:
             oneWon: games won by player1
             twoWon: games won by player2
             draws:  games won by nobody
         """
 
-        num = int(num / 2)
-        oneWon = 0
-        twoWon = 0
-        draws = 0
-        for _ in tqdm(range(num), desc="Arena.playGames (1)"):
-            gameResult = self.playGame(verbose=verbose)
-            if gameResult == 1:
-                oneWon += 1
-            elif gameResult == -1:
-                twoWon += 1
-            else:
-                draws += 1
-
-        self.player1, self.player2 = self.player2, self.player1
-
-        for _ in tqdm(range(num), desc="Arena.playGames (2)"):
-            gameResult = self.playGame(verbose=verbose)
-            if gameResult == 1:
-                twoWon += 1
-            elif gameResult == -1:
-                oneWon += 1
-            else:
-                draws += 1
-
-        return oneWon, twoWon, draws
+        def play(games, finished):
+            for j, (swapped, start) in enumerate(tqdm(games, desc="Arena.playGames")):
+                result = runSteps(self.matchGameSteps(self.player1, self.player2, swapped, start, verbose=verbose))
+                if finished(j, result):
+                    return
+
+        return self.playMatch(self.matchGames(num, stopper), play, stopper)
+
+    def playGamesBatched(self, num, batch_size, playerFactories, stopper=None):
+        """
+        Plays num games like playGames, but up to batch_size of them at once in
+        this process, evaluating the leaves of all running games in batches
+        (see MCTS.runBatched). Every game gets fresh players from
+        playerFactories, so concurrent games do not share search trees.
+
+        A stopper works like in playGames; it is called whenever a game
+        finishes and stopping abandons the games that are still running.
+
+        Input:
+            playerFactories: pair of functions that return a new player1 and
+                             player2, e.g. lambda: MCTS(...).bestActionSteps
+
+        Returns:
+            oneWon: games won by player1
+            twoWon: games won by player2
+            draws:  games won by nobody
+        """
+        newPlayer1, newPlayer2 = playerFactories
+
+        def gameSteps(swapped, start):
+            return (yield from self.matchGameSteps(newPlayer1(), newPlayer2(), swapped, start))
+
+        def play(games, finished):
+            with tqdm(total=len(games), desc="Arena.playGamesBatched") as progress:
+                runBatched([gameSteps(*game) for game in games], batch_size,
+                           callback=lambda j, result: progress.update(), stop=finished)
+
+        return self.playMatch(self.matchGames(num, stopper), play, stopper)
+
+    def playGamesParallel(self, num, workers, playerFactories, stopper=None, context=None):
+        """
+        Plays num games like playGames, spread over a pool of worker processes.
+        Every game gets fresh players from playerFactories, called in the
+        worker, so the factories must be picklable (e.g. MCTSPlayerFactory,
+        which loads its network once per worker). The results stream back as
+        the games finish; a stopper works like in playGamesBatched.
+
+        Returns:
+            oneWon: games won by player1
+            twoWon: games won by player2
+            draws:  games won by nobody
+        """
+        context = context or processContext()
+
+        def play(games, finished):
+            if not games:
+                return
+            with context.Pool(workers, initializer=initArenaWorker,
+                              initargs=(self.game, playerFactories, self.adjudicator)) as pool:
+                tasks = [(j, swapped, start) for j, (swapped, start) in enumerate(games)]
+                for j, result in tqdm(pool.imap_unordered(playArenaGame, tasks), total=len(tasks),
+                                      desc="Arena.playGamesParallel"):
+                    if finished(j, result):
+                        break  # leaving the pool terminates the games still running
+
+        return self.playMatch(self.matchGames(num, stopper), play, stopper)
+
+
+class MCTSPlayerFactory():
+    """
+    Picklable player factory for Arena.playGamesParallel: builds MCTS players
+    for the network in the checkpoint folder/filename. The network is loaded
+    on the first call, so once per worker; every call returns a player with a
+    fresh search tree. With a SharedEvalTable, the workers share the
+    network's evaluations in it.
+    """
+
+    def __init__(self, game, nnet_class, args, folder, filename, table=None):
+        self.game = game
+        self.nnet_class = nnet_class
+        self.args = args
+        self.folder = folder
+        self.filename = filename
+        self.table = table
+        self.nnet = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['nnet'] = None  # every process loads its own copy
+        return state
+
+    def __call__(self):
+        if self.nnet is None:
+            self.nnet = self.nnet_class(self.game)
+            self.nnet.load_checkpoint(folder=self.folder, filename=self.filename)
+            if self.table is not None:
+                self.nnet = SharedCacheNNet(self.nnet, self.table, checkpointVersion(self.folder, self.filename))
+        return MCTS(self.game, self.nnet, self.args).bestActionSteps
+
+
+arenaWorker = None  # (Arena, playerFactories) of a pool process
+
+
+def initArenaWorker(game, playerFactories, adjudicator=None):
+    global arenaWorker
+    if 'torch' in sys.modules:
+        # the workers already use all cores, more threads per worker only compete for them
+        sys.modules['torch'].set_num_threads(1)
+    arenaWorker = (Arena(None, None, game, adjudicator=adjudicator), playerFactories)
+
+
+def playArenaGame(task):
+    """
+    Plays game (index, swapped, start) of Arena.playGamesParallel in a worker.
+
+    Returns:
+        index: the index of the game
+        result: the result from the perspective of the first factory's player
+    """
+    index, swapped, start = task
+    arena, (newPlayer1, newPlayer2) = arenaWorker
+    return index, runSteps(arena.matchGameSteps(newPlayer1(), newPlayer2(), swapped, start))
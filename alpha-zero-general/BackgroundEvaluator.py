@@ -0,0 +1,124 @@
+import logging
+from queue import Empty
+
+import numpy as np
+
+from Adjudicator import Adjudicator
+from Arena import Arena
+from MCTS import MCTS
+from utils import dotdict, processContext
+
+log = logging.getLogger(__name__)
+
+
+class BackgroundEvaluator():
+    """
+    Evaluates checkpoints against a pool of earlier checkpoints in a background
+    process, one evaluation at a time, while training goes on.
+
+    A candidate plays args.evalGames games (half of them as first player)
+    against every checkpoint in the pool. Its score is the mean of its
+    (wins + draws / 2) / games over the pool. Candidates scoring at least
+    args.rollbackThreshold join the pool, which keeps the args.evalPoolSize
+    most recent of them.
+    """
+
+    def __init__(self, game, nnet_class, args, context=None):
+        self.game = game
+        self.nnet_class = nnet_class
+        self.args = args
+        self.context = context or processContext()
+        self.pool = []  # filenames of the checkpoints that passed, oldest first
+        self.process = None
+        self.candidate = None  # filename of the checkpoint being evaluated
+        self.results = self.context.Queue()
+
+    def addToPool(self, filename):
+        self.pool.append(filename)
+        del self.pool[:-(self.args.get('evalPoolSize') or 3)]
+
+    def submit(self, filename):
+        """
+        Starts evaluating checkpoint filename, unless an evaluation is still
+        running.
+
+        Returns:
+            started: whether the evaluation was started
+        """
+        if self.process is not None:
+            log.warning(f'Still evaluating {self.candidate}, skipping {filename}')
+            return False
+        self.candidate = filename
+        self.process = self.context.Process(target=evaluateCheckpoint, daemon=True,
+                                            args=(self.game, self.nnet_class, self.args, filename, list(self.pool),
+                                                  self.results))
+        self.process.start()
+        return True
+
+    def poll(self, block=False):
+        """
+        Collects the result of the running evaluation if it has finished (or
+        waits for it if block is set).
+
+        Returns:
+            result: (filename, score) of the finished evaluation, or None
+
+        Raises RuntimeError if the evaluation process stopped without a result.
+        """
+        if self.process is None:
+            return None
+        result = None
+        while result is None:
+            # a blocking poll checks the process every second, so an evaluation that dies is noticed
+            try:
+                result = self.results.get(block=block, timeout=1 if block else None)
+            except Empty:
+                if not self.process.is_alive():
+                    break
+                if not block:
+                    return None
+        if result is None:
+            # the process may have put its result and exited after the get above, read the queue once more
+            self.process.join()
+            try:
+                result = self.results.get(timeout=1)
+            except Empty:
+                self.process = None
+                raise RuntimeError(f'Evaluation of {self.candidate} failed')
+        filename, scores = result
+        self.process.join()
+        self.process = None
+
+        score = float(np.mean(list(scores.values()))) if scores else 1.
+        log.info(f'Evaluated {filename}: score {score:.2f} against the pool ('
+                 + ', '.join(f'{opponent}: {s:.2f}' for opponent, s in scores.items()) + ')')
+        if score >= self.args.get('rollbackThreshold', 0.3):
+            self.addToPool(filename)
+        return filename, score
+
+
+def evaluateCheckpoint(game, nnet_class, args, filename, pool, results):
+    """
+    Main function of the evaluation process, see BackgroundEvaluator.
+    """
+    args = dotdict({**args, 'openingBook': None})  # the book was searched by one of the networks
+    nnet = nnet_class(game)
+    nnet.load_checkpoint(folder=args.checkpoint, filename=filename)
+    opponent = nnet_class(game)
+    scores = {}
+    for opponentFile in pool:
+        opponent.load_checkpoint(folder=args.checkpoint, filename=opponentFile)
+        cmcts = MCTS(game, nnet, args)
+        omcts = MCTS(game, opponent, args)
+        arena = Arena(lambda x: np.argmax(cmcts.getActionProb(x, temp=0)),
+                      lambda x: np.argmax(omcts.getActionProb(x, temp=0)), game,
+                      adjudicator=Adjudicator.fromArgs(game, args, nnets=[nnet, opponent]))
+        games = args.get('evalGames') or args.arenaCompare
+        if (args.get('arenaBatchSize') or 1) > 1:
+            wins, losses, draws = arena.playGamesBatched(games, args.arenaBatchSize,
+                                                         (lambda: MCTS(game, nnet, args).bestActionSteps,
+                                                          lambda: MCTS(game, opponent, args).bestActionSteps))
+        else:
+            wins, losses, draws = arena.playGames(games)
+        scores[opponentFile] = (wins + draws / 2) / max(1, wins + losses + draws)
+    results.put((filename, scores))
@@ -0,0 +1,51 @@
+import numpy as np
+
+from utils import LRUCache
+
+
+class CachedGame():
+    """
+    Wraps a Game and memoizes its pure rule functions getValidMoves and
+    getGameEnded in an LRUCache of capacity entries, keyed by the player and
+    the stringRepresentation of the board. Everything else is passed through
+    to the wrapped game.
+
+    This removes the rule work that is repeated outside the search trees, by
+    Arena, Coach, players and new trees on positions seen before. The valid
+    moves are returned read-only, since every caller of a position shares
+    them. The cache's hit and miss counts are in cache.
+    """
+
+    def __init__(self, game, capacity):
+        self.game = game
+        self.cache = LRUCache(capacity)
+
+    def __getattr__(self, name):
+        if name in ('game', 'cache'):
+            raise AttributeError(name)  # not set yet, e.g. while unpickling
+        return getattr(self.game, name)
+
+    def __getstate__(self):
+        # every process starts with an empty cache
+        return {'game': self.game, 'capacity': self.cache.capacity}
+
+    def __setstate__(self, state):
+        self.game = state['game']
+        self.cache = LRUCache(state['capacity'])
+
+    def getValidMoves(self, board, player):
+        key = ('valids', player, self.game.stringRepresentation(board))
+        valids = self.cache.get(key)
+        if valids is None:
+            valids = np.array(self.game.getValidMoves(board, player))
+            valids.setflags(write=False)
+            self.cache.put(key, valids)
+        return valids
+
+    def getGameEnded(self, board, player):
+        key = ('ended', player, self.game.stringRepresentation(board))
+        ended = self.cache.get(key)
+        if ended is None:
+            ended = self.game.getGameEnded(board, player)
+            self.cache.put(key, ended)
+        return ended
@@ -0,0 +1,81 @@
+import logging
+import os
+import queue
+import threading
+
+log = logging.getLogger(__name__)
+
+TMP_PREFIX = 'tmp-'  # prefix of the files of a checkpoint that is being written
+
+
+class CheckpointWriter():
+    """
+    Writes checkpoints of networks on a background thread, so training does
+    not wait for the disk.
+
+    save takes an in-memory snapshot of the network (get_weights) at once.
+    The thread loads it into a network of its own, saves it under a
+    temporary name and renames the files into place, so a checkpoint file is
+    always either the complete previous or the complete new one. An error of
+    the thread is raised by the next save or wait.
+    """
+
+    def __init__(self, game, nnet_class):
+        self.game = game
+        self.nnet_class = nnet_class
+        self.nnet = None  # the network of the thread, created on first use
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def save(self, nnet, folder, filenames):
+        """
+        Saves the current weights of nnet as every checkpoint folder/filename
+        of filenames in the background.
+        """
+        self.checkError()
+        self.queue.put((nnet.get_weights(), folder, list(filenames)))
+
+    def wait(self):
+        """
+        Blocks until all checkpoints saved so far are written.
+        """
+        self.queue.join()
+        self.checkError()
+
+    def close(self):
+        self.wait()
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                weights, folder, filenames = item
+                if self.nnet is None:
+                    self.nnet = self.nnet_class(self.game)
+                self.nnet.set_weights(weights)
+                for filename in filenames:
+                    self.write(folder, filename)
+            except Exception as e:
+                log.exception('Writing a checkpoint failed')
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def write(self, folder, filename):
+        # the networks may store a checkpoint under derived names (e.g. with a .h5 suffix), rename all of them
+        self.nnet.save_checkpoint(folder=folder, filename=TMP_PREFIX + filename)
+        prefix = TMP_PREFIX + filename.split('.')[0] + '.'
+        for name in os.listdir(folder):
+            if name.startswith(prefix):
+                os.replace(os.path.join(folder, name), os.path.join(folder, name[len(TMP_PREFIX):]))
+
+    def checkError(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f'Writing a checkpoint failed: {error!r}')
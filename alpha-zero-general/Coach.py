@@ -1,15 +1,30 @@
 import logging
 import os
+import random
 import sys
-from collections import deque
-from pickle import Pickler, Unpickler
-from random import shuffle
+from pickle import Unpickler
+from queue import Empty, Full
 
 import numpy as np
 from tqdm import tqdm
 
-from Arena import Arena
-from MCTS import MCTS
+from Adjudicator import Adjudicator
+from Arena import Arena, MCTSPlayerFactory
+from BackgroundEvaluator import BackgroundEvaluator
+from CachedGame import CachedGame
+from CheckpointWriter import CheckpointWriter
+from CompactExamples import CompactExamples
+from GameCache import GameCache, checkpointHash
+from InferenceServer import InferenceServer, RemoteNNetWrapper, formatStats
+from MCTS import MCTS, evalCache, runBatched, runSteps
+from OpeningBook import OpeningBook
+from ReplayBuffer import ReplayBuffer, ReplaySample
+from ReplayStore import ReplayStore
+from Reanalyser import Reanalyser
+from SharedEvalTable import SharedCacheNNet, SharedEvalTable, checkpointVersion
+from Resignation import Resignation
+from SPRT import SPRT
+from utils import dotdict, processContext
 
 log = logging.getLogger(__name__)
 
@@ -21,12 +36,28 @@ class Coach():
     """
 
     def __init__(self, game, nnet, args):
+        if args.get('rulesCacheSize'):
+            # memoize the valid moves and game ends of positions, see CachedGame
+            game = CachedGame(game, args.rulesCacheSize)
         self.game = game
         self.nnet = nnet
         self.pnet = self.nnet.__class__(self.game)  # the competitor network
         self.args = args
         self.mcts = MCTS(self.game, self.nnet, self.args)
-        self.trainExamplesHistory = []  # history of examples from args.numItersForTrainExamplesHistory latest iterations
+        self.trainExamplesHistory = []  # CompactExamples from args.numItersForTrainExamplesHistory latest iterations
+        self.newTrainExamples = None  # examples of the current iteration that are not yet in the replay store
+        self.replayStore = ReplayStore(os.path.join(self.args.checkpoint, 'replay'))
+        self.replayBuffer = None  # used instead of trainExamplesHistory if args.replayBufferSize is set
+        self.evaluator = None  # BackgroundEvaluator of the gating-free mode
+        self.arenaCache = None  # GameCache of the gating games if args.arenaCache is set
+        self.checkpointWriter = None  # CheckpointWriter of saveCheckpoints, created on first use
+        self.resignation = None  # Resignation of self-play if args.resignThreshold is set
+        if self.args.get('resignThreshold') is not None:
+            self.resignation = Resignation(self.args.resignThreshold, moves=self.args.get('resignMoves') or 3,
+                                           playtestFraction=self.args.get('resignPlaytestFraction', 0.1),
+                                           falsePositiveRate=self.args.get('resignFalsePositiveRate', 0.05),
+                                           minGames=self.args.get('resignCalibrationGames') or 20,
+                                           minResignations=self.args.get('resignCalibrationResignations') or 10)
         self.skipFirstSelfPlay = False  # can be overriden in loadTrainExamples()
 
     def executeEpisode(self):
@@ -45,28 +76,61 @@ class Coach():
                            pi is the MCTS informed policy vector, v is +1 if
                            the player eventually won the game, else -1.
         """
+        return runSteps(self.episodeSteps(self.mcts))
+
+    def episodeSteps(self, mcts, resign=None):
+        """
+        Step generator version of executeEpisode that searches with mcts, see
+        MCTS.searchSteps.
+
+        With a ResignGame resign, the player to move resigns (and loses) when
+        resign.observe says so after the search. Games that repeat positions
+        or run too long are ended by an Adjudicator (see
+        Adjudicator.fromArgs), which evaluates positions with mcts.nnet.
+
+        With args.fullSearchProb set (playout cap randomization), only that
+        fraction of the moves is searched with numMCTSSims simulations and
+        recorded as examples. The others use a fast search of
+        args.fastSearchSims simulations (default numMCTSSims // 4, at least
+        2) and are played but not recorded.
+        """
         trainExamples = []
         board = self.game.getInitBoard()
-        self.curPlayer = 1
+        curPlayer = 1
         episodeStep = 0
+        adjudicator = Adjudicator.fromArgs(self.game, self.args, nnets=[mcts.nnet])
+        seen = {}  # position hashes of the adjudicator
+        fullSearchProb = self.args.get('fullSearchProb')
+        # the first simulation of a new root only expands it, so a search needs at least two to visit a move
+        fastSearchSims = self.args.get('fastSearchSims') or max(2, self.args.numMCTSSims // 4)
 
         while True:
             episodeStep += 1
-            canonicalBoard = self.game.getCanonicalForm(board, self.curPlayer)
+            canonicalBoard = self.game.getCanonicalForm(board, curPlayer)
             temp = int(episodeStep < self.args.tempThreshold)
 
-            pi = self.mcts.getActionProb(canonicalBoard, temp=temp)
-            sym = self.game.getSymmetries(canonicalBoard, pi)
-            for b, p in sym:
-                trainExamples.append([b, self.curPlayer, p, None])
+            fullSearch = fullSearchProb is None or np.random.random() < fullSearchProb
+            numSims = None if fullSearch else fastSearchSims
+            pi = yield from mcts.getActionProbSteps(canonicalBoard, temp=temp, numSims=numSims)
+            if fullSearch:
+                sym = self.game.getSymmetries(canonicalBoard, pi)
+                for b, p in sym:
+                    trainExamples.append([b, curPlayer, p, None])
+
+            if resign is not None and resign.observe(curPlayer, mcts.rootValue(canonicalBoard)):
+                return [(x[0], x[2], -1 if x[1] == curPlayer else 1) for x in trainExamples]
 
             action = np.random.choice(len(pi), p=pi)
-            board, self.curPlayer = self.game.getNextState(board, self.curPlayer, action)
+            board, curPlayer = self.game.getNextState(board, curPlayer, action)
 
-            r = self.game.getGameEnded(board, self.curPlayer)
+            r = self.game.getGameEnded(board, curPlayer)
+            if r == 0:
+                r = yield from adjudicator.adjudicateSteps(board, curPlayer, episodeStep, seen)
 
-            if r != 0:
-                return [(x[0], x[2], r * ((-1) ** (x[1] != self.curPlayer))) for x in trainExamples]
+            if r is not None:
+                if resign is not None:
+                    resign.finish(int(round(r * curPlayer)) if abs(r) == 1 else 0)
+                return [(x[0], x[2], r * ((-1) ** (x[1] != curPlayer))) for x in trainExamples]
 
     def learn(self):
         """
@@ -75,71 +139,644 @@ class Coach():
         examples in trainExamples (which has a maximum length of maxlenofQueue).
         It then pits the new neural network against the old one and accepts it
         only if it wins >= updateThreshold fraction of games.
+
+        If args.gatingFree is set, every new network is accepted instead and
+        checked in the background, see acceptGatingFree.
+
+        If args.asyncSelfPlay is set, it runs learnAsync instead.
+
+        With args.openingBookPlies set, the opening book at args.openingBook
+        is built at the start if it does not exist and rebuilt whenever a
+        network is accepted, see updateOpeningBook.
+
+        The previous network is kept as an in-memory snapshot of the weights;
+        accepted networks are checkpointed in the background (see
+        saveCheckpoints), and all checkpoints are on disk when learn returns.
         """
+        if self.args.get('openingBookPlies') and not os.path.isfile(self.args.openingBook):
+            self.updateOpeningBook()
+        if self.args.get('asyncSelfPlay'):
+            return self.learnAsync()
+        if self.args.get('gatingFree'):
+            self.evaluator = BackgroundEvaluator(self.game, self.nnet.__class__, self.args,
+                                                 processContext(self.args.get('selfPlayStartMethod')))
+            self.nnet.save_checkpoint(folder=self.args.checkpoint, filename=self.getCheckpointFile(0))
+            self.evaluator.addToPool(self.getCheckpointFile(0))
 
         for i in range(1, self.args.numIters + 1):
             # bookkeeping
             log.info(f'Starting Iter #{i} ...')
             # examples of the iteration
+            episodes = None
             if not self.skipFirstSelfPlay or i > 1:
-                iterationTrainExamples = deque([], maxlen=self.args.maxlenOfQueue)
-
-                for _ in tqdm(range(self.args.numEps), desc="Self Play"):
-                    self.mcts = MCTS(self.game, self.nnet, self.args)  # reset search tree
-                    iterationTrainExamples += self.executeEpisode()
-
-                # save the iteration examples to the history 
-                self.trainExamplesHistory.append(iterationTrainExamples)
+                episodes = self.selfPlay(i)
+            self.storeTrainExamples(episodes, i)
+            if self.args.get('reanalyseFraction'):
+                self.reanalyse(i)
 
-            if len(self.trainExamplesHistory) > self.args.numItersForTrainExamplesHistory:
-                log.warning(
-                    f"Removing the oldest entry in trainExamples. len(trainExamplesHistory) = {len(self.trainExamplesHistory)}")
-                self.trainExamplesHistory.pop(0)
-            # backup history to a file
-            # NB! the examples were collected using the model from the previous iteration, so (i-1)  
-            self.saveTrainExamples(i - 1)
+            # the networks shuffle the examples themselves and expand the policies batch by batch
+            trainExamples = self.getTrainExamples()
+            if trainExamples is None:
+                log.warning(f'No examples to train on in iteration {i}, skipping training and gating')
+                continue
+            log.info(f'Training on {len(trainExamples)} examples')
 
-            # shuffle examples before training
-            trainExamples = []
-            for e in self.trainExamplesHistory:
-                trainExamples.extend(e)
-            shuffle(trainExamples)
+            if self.evaluator is not None:
+                self.trainNetwork(trainExamples)
+                self.acceptGatingFree(i)
+                continue
 
             # training new network, keeping a copy of the old one
-            self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
-            self.pnet.load_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
+            previous = self.nnet.get_weights()
+            self.pnet.set_weights(previous)
             pmcts = MCTS(self.game, self.pnet, self.args)
 
-            self.nnet.train(trainExamples)
+            self.trainNetwork(trainExamples)
             nmcts = MCTS(self.game, self.nnet, self.args)
 
             log.info('PITTING AGAINST PREVIOUS VERSION')
-            arena = Arena(lambda x: np.argmax(pmcts.getActionProb(x, temp=0)),
-                          lambda x: np.argmax(nmcts.getActionProb(x, temp=0)), self.game)
-            pwins, nwins, draws = arena.playGames(self.args.arenaCompare)
+            pwins, nwins, draws = self.pitAgainstPrevious(pmcts, nmcts)
 
             log.info('NEW/PREV WINS : %d / %d ; DRAWS : %d' % (nwins, pwins, draws))
             if pwins + nwins == 0 or float(nwins) / (pwins + nwins) < self.args.updateThreshold:
                 log.info('REJECTING NEW MODEL')
-                self.nnet.load_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
+                self.nnet.set_weights(previous)
             else:
                 log.info('ACCEPTING NEW MODEL')
-                self.nnet.save_checkpoint(folder=self.args.checkpoint, filename=self.getCheckpointFile(i))
-                self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='best.pth.tar')
+                self.saveCheckpoints(self.getCheckpointFile(i), 'best.pth.tar')
+                if self.args.get('openingBookPlies'):
+                    self.updateOpeningBook()
+
+        if self.evaluator is not None:
+            # the final network should not be one that fails its evaluation
+            self.applyEvaluation(self.evaluator.poll(block=True))
+        self.flushCheckpoints()
+
+    def pitAgainstPrevious(self, pmcts, nmcts):
+        """
+        Plays the arenaCompare gating games between the previous network
+        (pnet) and the new one: spread over
+        args.arenaWorkers processes, args.arenaBatchSize at once in this
+        process, or one after the other with the trees pmcts and nmcts. With
+        args.arenaSPRT set, the match stops as soon as the decision is settled.
+
+        With args.arenaCache set, every game gets fresh trees and the results
+        are kept in a GameCache (arena_cache.json in the checkpoint folder)
+        keyed by the checkpoint contents, so identical games, e.g. from the
+        same start position with the same first mover, are played only once.
+        args.arenaOpeningMoves random moves at the start of every game pair
+        make the games differ. With args.sharedEvalSlots set, the arenaWorkers
+        share the networks' evaluations in a SharedEvalTable.
+
+        The players do not use the opening book (args.openingBook), which was
+        searched by one of the two networks.
+
+        Returns:
+            pwins, nwins, draws: the results of the match
+        """
+        args = dotdict({**self.args, 'openingBook': None})
+        pmcts.book = nmcts.book = None
+        playerKeys = None
+        workers = self.args.get('arenaWorkers') or 1
+        if self.args.get('arenaCache') or workers > 1:
+            # the cache keys and the workers' networks come from the checkpoint
+            self.pnet.save_checkpoint(folder=self.args.checkpoint, filename='temp.pth.tar')
+        if self.args.get('arenaCache'):
+            if self.arenaCache is None:
+                self.arenaCache = GameCache(os.path.join(self.args.checkpoint, 'arena_cache.json'))
+            self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='arena.pth.tar')
+            search = (f'{self.args.numMCTSSims}-{self.args.cpuct}-{self.args.get("maxMoves", 500)}-'
+                      f'{self.args.get("repetitions")}-{self.args.get("adjudication")}')
+            playerKeys = tuple(f'{checkpointHash(self.args.checkpoint, filename)}-{search}'
+                               for filename in ('temp.pth.tar', 'arena.pth.tar'))
+        arena = Arena(lambda x: np.argmax(pmcts.getActionProb(x, temp=0)),
+                      lambda x: np.argmax(nmcts.getActionProb(x, temp=0)), self.game,
+                      cache=self.arenaCache if playerKeys else None, playerKeys=playerKeys,
+                      openingMoves=self.args.get('arenaOpeningMoves') or 0,
+                      adjudicator=Adjudicator.fromArgs(self.game, self.args, nnets=[self.pnet, self.nnet]))
+        stopper = None
+        if self.args.get('arenaSPRT'):
+            # stop the match as soon as the decision is settled
+            test = SPRT(self.args.updateThreshold, 2 * int(self.args.arenaCompare / 2),
+                        alpha=self.args.get('sprtAlpha') or 0.05, beta=self.args.get('sprtBeta') or 0.05,
+                        delta=self.args.get('sprtDelta') or 0.1)
+            stopper = lambda pwins, nwins, draws: test(nwins, pwins, draws)
+
+        if workers > 1:
+            if playerKeys is None:
+                self.nnet.save_checkpoint(folder=self.args.checkpoint, filename='arena.pth.tar')
+            context = processContext(self.args.get('selfPlayStartMethod'))
+            self.flushCheckpoints()  # see selfPlayPool
+            table = None
+            if self.args.get('sharedEvalSlots'):
+                table = SharedEvalTable(self.game.getActionSize(), self.args.sharedEvalSlots, context=context)
+            factories = (MCTSPlayerFactory(self.game, self.pnet.__class__, args, self.args.checkpoint,
+                                           'temp.pth.tar', table),
+                         MCTSPlayerFactory(self.game, self.nnet.__class__, args, self.args.checkpoint,
+                                           'arena.pth.tar', table))
+            try:
+                return arena.playGamesParallel(self.args.arenaCompare, workers, factories, stopper=stopper,
+                                               context=context)
+            finally:
+                if table is not None:
+                    table.close()
+        if (self.args.get('arenaBatchSize') or 1) > 1 or playerKeys is not None:
+            # every game gets its own trees, so the games can run concurrently and depend only on their start
+            return arena.playGamesBatched(self.args.arenaCompare, self.args.get('arenaBatchSize') or 1,
+                                          (lambda: MCTS(self.game, self.pnet, args).bestActionSteps,
+                                           lambda: MCTS(self.game, self.nnet, args).bestActionSteps),
+                                          stopper=stopper)
+        return arena.playGames(self.args.arenaCompare, stopper=stopper)
+
+    def acceptGatingFree(self, iteration):
+        """
+        Accepts the newly trained network without an arena match. Every
+        args.evalEvery iterations its checkpoint is handed to the
+        BackgroundEvaluator, and whenever an earlier evaluation has finished
+        its result is applied, see applyEvaluation.
+        """
+        log.info('ACCEPTING NEW MODEL')
+        self.saveCheckpoints(self.getCheckpointFile(iteration), 'best.pth.tar')
+        if self.applyEvaluation(self.evaluator.poll()):
+            return
+        if self.args.get('openingBookPlies'):
+            self.updateOpeningBook()
+        if iteration % (self.args.get('evalEvery') or 1) == 0:
+            self.flushCheckpoints()  # the evaluator reads the checkpoint
+            self.evaluator.submit(self.getCheckpointFile(iteration))
+
+    def applyEvaluation(self, result):
+        """
+        Rolls the network back to the newest checkpoint of the evaluation pool
+        if an evaluated checkpoint scored below args.rollbackThreshold against
+        the pool.
+
+        Returns:
+            rolledBack: whether the network was rolled back
+        """
+        if result is None:
+            return False
+        filename, score = result
+        if score >= self.args.get('rollbackThreshold', 0.3):
+            return False
+        good = self.evaluator.pool[-1]
+        log.warning(f'{filename} scored {score:.2f} against the evaluation pool, rolling back to {good}')
+        self.nnet.load_checkpoint(folder=self.args.checkpoint, filename=good)
+        self.saveCheckpoints('best.pth.tar')
+        if self.args.get('openingBookPlies'):
+            self.updateOpeningBook()
+        return True
+
+    def saveCheckpoints(self, *filenames):
+        """
+        Saves the current network as the checkpoints filenames in
+        args.checkpoint on a background thread, see CheckpointWriter.
+        """
+        if self.checkpointWriter is None:
+            self.checkpointWriter = CheckpointWriter(self.game, self.nnet.__class__)
+        self.checkpointWriter.save(self.nnet, self.args.checkpoint, filenames)
+
+    def flushCheckpoints(self):
+        """
+        Waits until the checkpoints of saveCheckpoints are on disk.
+        """
+        if self.checkpointWriter is not None:
+            self.checkpointWriter.wait()
+
+    def updateOpeningBook(self):
+        """
+        Rebuilds the opening book at args.openingBook with the current network
+        for args.openingBookPlies plies: searches of args.openingBookSims
+        (default 10 * numMCTSSims) simulations that follow the
+        args.openingBookWidth (default 3) most visited moves, see OpeningBook.
+        The MCTS instances of all processes pick up the new file.
+        """
+        book = OpeningBook.build(self.game, self.nnet, self.args, self.args.openingBookPlies,
+                                 self.args.get('openingBookSims') or 10 * self.args.numMCTSSims,
+                                 width=self.args.get('openingBookWidth') or 3,
+                                 batchSize=self.args.get('selfPlayBatchSize') or 1)
+        book.save(self.args.openingBook)
+        log.info(f'Opening book: {len(book)} positions')
+
+    def learnAsync(self):
+        """
+        Actor-learner version of learn: args.numSelfPlayWorkers actor processes
+        play self-play episodes continuously while this process trains.
+
+        Actors send the examples of every episode, tagged with the version of
+        the weights they were played with, through a queue of
+        args.asyncQueueSize episodes (actors wait when it is full). Episodes
+        played with weights more than args.maxStaleness versions older than
+        the latest published ones are dropped. Every args.asyncEpisodesPerRound
+        accepted episodes (default numEps) the learner stores them like an
+        iteration of learn and trains on the window. Every args.publishEvery
+        such rounds it publishes the new weights, which the actors load
+        between games. There is no arena gating in this mode. The resign
+        threshold (see selfPlay) is shared with the actors and recalibrated
+        every round.
+        """
+        context = processContext(self.args.get('selfPlayStartMethod'))
+        version = context.Value('i', 0)
+        stop = context.Event()
+        queue = context.Queue(self.args.get('asyncQueueSize') or 2 * self.args.numEps)
+        threshold = context.Value('d', self.resignation.threshold if self.resignation is not None else 0)
+        self.publishWeights(version, 0)
+
+        actors = [context.Process(target=runActor, daemon=True,
+                                  args=(self.game, self.nnet.__class__, self.args, version, queue, stop, actor,
+                                        self.resignation, threshold))
+                  for actor in range(self.args.get('numSelfPlayWorkers') or 1)]
+        for actor in actors:
+            actor.start()
+
+        maxStaleness = self.args.get('maxStaleness')
+        episodesPerRound = self.args.get('asyncEpisodesPerRound') or self.args.numEps
+        try:
+            for i in range(1, self.args.numIters + 1):
+                log.info(f'Starting Round #{i} ...')
+                episodes = []
+                games = []
+                dropped = 0
+                with tqdm(total=episodesPerRound, desc="Self Play") as progress:
+                    while len(episodes) < episodesPerRound:
+                        try:
+                            played, examples, game = queue.get(timeout=1)
+                        except Empty:
+                            if not any(actor.is_alive() for actor in actors):
+                                raise RuntimeError('All self-play actors have stopped')
+                            continue
+                        if maxStaleness is not None and version.value - played > maxStaleness:
+                            dropped += 1
+                            continue
+                        episodes.append(examples)
+                        games.append(game)
+                        progress.update()
+                if dropped:
+                    log.warning(f'Dropped {dropped} episodes played with stale weights')
+                if self.resignation is not None:
+                    self.resignation.update(games)
+                    threshold.value = self.resignation.threshold
+                self.storeTrainExamples(episodes, i)
+                if self.args.get('reanalyseFraction'):
+                    self.reanalyse(i)
+
+                trainExamples = self.getTrainExamples()
+                if trainExamples is None:
+                    log.warning(f'No examples to train on in round {i}, skipping training')
+                    continue
+                log.info(f'Training on {len(trainExamples)} examples')
+                self.trainNetwork(trainExamples)
+
+                if i % (self.args.get('publishEvery') or 1) == 0:
+                    self.publishWeights(version, version.value + 1)
+                    self.saveCheckpoints(self.getCheckpointFile(i), 'best.pth.tar')
+        finally:
+            stop.set()
+            # actors waiting on a full queue notice the stop after their next put timeout
+            for actor in actors:
+                while actor.is_alive():
+                    try:
+                        queue.get(timeout=0.1)
+                    except Empty:
+                        pass
+                    actor.join(timeout=0.1)
+        self.flushCheckpoints()
+
+    def publishWeights(self, version, number):
+        """
+        Saves the current weights as published version number, makes the
+        actors load them and deletes the version before the previous one,
+        which no actor can still be about to load.
+        """
+        self.nnet.save_checkpoint(folder=self.args.checkpoint, filename=getPublishedFile(number))
+        version.value = number
+        log.info(f'Published weights version {number}')
+        old = getPublishedFile(number - 2).split('.')[0] + '.'
+        for filename in os.listdir(self.args.checkpoint):
+            if filename.startswith(old):
+                os.remove(os.path.join(self.args.checkpoint, filename))
+
+    def storeTrainExamples(self, episodes, iteration):
+        """
+        Adds the examples of an iteration's episodes (a list of CompactExamples,
+        or None if no episodes were played) to the history, drops the examples
+        that fall out of the window and appends the new ones to the replay
+        store.
+        """
+        if episodes is not None:
+            # episodes with playout cap randomization can lack recorded moves
+            episodes = [e for e in episodes if len(e)] or None
+            if episodes is None:
+                log.warning(f'No examples were recorded in iteration {iteration}')
+        if episodes is not None:
+            # save the maxlenOfQueue most recent examples of the iteration to the history
+            iterationTrainExamples = CompactExamples.concatenate(episodes)
+            self.newTrainExamples = iterationTrainExamples.tail(self.args.maxlenOfQueue)
+            if self.args.get('aggregateExamples'):
+                # merge repeated positions (e.g. openings) into one weighted example
+                n = len(self.newTrainExamples)
+                self.newTrainExamples = self.newTrainExamples.aggregate()
+                log.info(f'Aggregated {n} examples into {len(self.newTrainExamples)} unique positions')
+            self.addTrainExamples(self.newTrainExamples, iteration)
+
+        if self.replayBuffer is not None:
+            self.replayBuffer.evict(iteration - self.args.numItersForTrainExamplesHistory + 1)
+        elif len(self.trainExamplesHistory) > self.args.numItersForTrainExamplesHistory:
+            log.warning(
+                f"Removing the oldest entry in trainExamples. len(trainExamplesHistory) = {len(self.trainExamplesHistory)}")
+            self.trainExamplesHistory.pop(0)
+        # append the new examples to the replay store
+        # NB! the examples were collected using the model from the previous iteration, so (i-1)
+        self.saveTrainExamples(iteration - 1)
+
+    def reanalyse(self, iteration):
+        """
+        Refreshes the targets of examples from earlier iterations with the
+        current network, see Reanalyser. args.reanalyseFraction sets the
+        compute share: the number of positions searched again, relative to the
+        number of examples the iteration added. They are sampled uniformly
+        from the older examples.
+
+        Examples in the replay buffer are changed in place. History entries
+        are rebuilt and replace their replay store segments.
+        """
+        if self.replayBuffer is not None:
+            ages = self.replayBuffer.ages[self.replayBuffer.slots()]
+            added = np.count_nonzero(ages == iteration)
+            older = np.flatnonzero(ages < iteration)
+        else:
+            added = len(self.trainExamplesHistory[-1]) if self.trainExamplesHistory else 0
+            sizes = [len(examples) for examples in self.trainExamplesHistory[:-1]]
+            older = np.arange(sum(sizes))
+        count = min(len(older), int(round(self.args.reanalyseFraction * added)))
+        if count == 0:
+            return
+        log.info(f'Reanalysing {count} of {len(older)} older examples')
+        indices = np.sort(np.random.choice(older, count, replace=False))
+        reanalyser = Reanalyser(self.game, self.nnet, self.args)
+
+        if self.replayBuffer is not None:
+            slots = self.replayBuffer.slots(indices)
+            policies, values = reanalyser.reanalyse(self.replayBuffer.boards[slots], self.replayBuffer.values[slots])
+            self.replayBuffer.setTargets(indices, policies, values)
+            return
+
+        starts = np.cumsum([0] + sizes)
+        entries = np.searchsorted(starts, indices, side='right') - 1
+        local = indices - starts[entries]
+        boards = [self.trainExamplesHistory[entry].boards[i] for entry, i in zip(entries, local)]
+        oldValues = [self.trainExamplesHistory[entry].values[i] for entry, i in zip(entries, local)]
+        policies, values = reanalyser.reanalyse(boards, oldValues)
+
+        # the last len(trainExamplesHistory) segments of the store hold the history
+        first = len(self.replayStore.segments) - len(self.trainExamplesHistory)
+        for entry in np.unique(entries):
+            rows = np.flatnonzero(entries == entry)
+            examples = self.trainExamplesHistory[entry].withTargets(local[rows], [policies[row] for row in rows],
+                                                                     values[rows])
+            if first >= 0:
+                examples = self.replayStore.replace(first + entry, examples)
+            self.trainExamplesHistory[entry] = examples
+
+    def addTrainExamples(self, examples, iteration):
+        """
+        Adds the CompactExamples of an iteration to the replay buffer or, if
+        there is none, to trainExamplesHistory.
+        """
+        if not self.args.get('replayBufferSize'):
+            self.trainExamplesHistory.append(examples)
+            return
+        if self.replayBuffer is None:
+            # a policy has at most as many entries as its search had simulations, wider ones widen the rows
+            sims = [self.args.numMCTSSims, self.args.get('reanalyseSims') or 0,
+                    (self.args.get('openingBookSims') or 10 * self.args.numMCTSSims)
+                    if self.args.get('openingBookPlies') else 0]
+            self.replayBuffer = ReplayBuffer(self.args.replayBufferSize, examples.boards.shape[1:],
+                                             examples.boards.dtype, self.game.getActionSize(),
+                                             min(self.game.getActionSize(), max(sims)))
+        self.replayBuffer.add(examples, iteration)
+        if self.args.get('prioritizedReplay'):
+            added = min(len(examples), self.replayBuffer.capacity)
+            self.updatePriorities(self.replayBuffer.slots(np.arange(len(self.replayBuffer) - added,
+                                                                    len(self.replayBuffer))))
+
+    def updatePriorities(self, slots, batch_size=1024):
+        """
+        Sets the priorities of the replay buffer slots to the value errors of
+        the current network on them, see ReplayBuffer.updateValueErrors.
+        """
+        slots = np.unique(slots)
+        for start in range(0, len(slots), batch_size):
+            chunk = slots[start:start + batch_size]
+            _, vs = self.nnet.predict_batch(self.replayBuffer.boards[chunk])
+            self.replayBuffer.updateValueErrors(chunk, np.asarray(vs).reshape(-1))
+
+    def trainNetwork(self, trainExamples):
+        """
+        Trains the network on trainExamples. After training on a prioritized
+        sample, the priorities of the sampled positions are refreshed with the
+        new network's value errors.
+        """
+        self.nnet.train(trainExamples)
+        if isinstance(trainExamples, ReplaySample):
+            self.updatePriorities(trainExamples.slots)
+
+    def getTrainExamples(self):
+        """
+        Returns the examples to train on: the replay buffer (or a prioritized
+        sample of it if args.prioritizedReplay is set), or the concatenated
+        trainExamplesHistory; None if there are no examples yet (e.g. when
+        playout cap randomization recorded no moves).
+
+        With args.prioritizedReplay, positions are drawn proportional to the
+        value error |z - v| of the network: new positions get theirs when they
+        are added, sampled ones again after every training, see
+        updatePriorities.
+        """
+        if self.replayBuffer is None:
+            if not self.trainExamplesHistory:
+                return None
+            return CompactExamples.concatenate(self.trainExamplesHistory)
+        if len(self.replayBuffer) == 0:
+            return None
+        if self.args.get('prioritizedReplay'):
+            return self.replayBuffer.sample(len(self.replayBuffer), prioritized=True)
+        return self.replayBuffer
+
+    def selfPlay(self, iteration):
+        """
+        Plays the numEps self-play episodes of an iteration, in a pool of
+        args.numSelfPlayWorkers processes if that is more than 1, or else
+        concurrently in this process if args.selfPlayBatchSize is more than 1
+        (see selfPlayBatched).
+
+        With args.resignThreshold set, games are resigned as described in
+        Resignation, which is recalibrated after every iteration. With
+        args.evalCacheSize set, the hit rate of the evaluation cache shared by
+        the episodes' trees is logged (see MCTS), likewise that of the rules
+        cache with args.rulesCacheSize set (see CachedGame).
+
+        Returns:
+            examples: list of CompactExamples, one per episode
+        """
+        games = [self.resignation.newGame() if self.resignation is not None else None
+                 for _ in range(self.args.numEps)]
+        evalCache.resetStats()
+        if self.args.get('rulesCacheSize'):
+            self.game.cache.resetStats()
+        workers = self.args.get('numSelfPlayWorkers') or 1
+        if workers <= 1 and (self.args.get('selfPlayBatchSize') or 1) > 1:
+            episodes = self.selfPlayBatched(iteration, games)
+        elif workers <= 1:
+            episodes = [self.playEpisode(iteration, episode, games[episode])
+                        for episode in tqdm(range(self.args.numEps), desc="Self Play")]
+        else:
+            episodes, games = self.selfPlayPool(iteration, workers, games)
+        if self.resignation is not None:
+            self.resignation.update(games)
+        if self.args.get('evalCacheSize') and workers <= 1:
+            log.info(f'Evaluation cache: {evalCache}')
+        if self.args.get('rulesCacheSize') and workers <= 1:
+            log.info(f'Rules cache: {self.game.cache}')
+        return episodes
+
+    def selfPlayPool(self, iteration, workers, games):
+        """
+        Plays the self-play episodes of an iteration in a pool of worker
+        processes, see selfPlay. Every worker loads the current network once,
+        or, if args.inferenceServer is set, all workers share one copy of it in
+        an InferenceServer that batches their requests (args.inferenceMaxWait
+        seconds at most). Episodes are handed out one at a time and their
+        examples are returned in episode order, so the result does not depend
+        on which worker played which episode.
+
+        With args.sharedEvalSlots set, the workers share their network
+        evaluations in a SharedEvalTable of that many slots.
+
+        Returns:
+            examples: list of CompactExamples, one per episode
+            games: the finished ResignGames (or Nones) of the episodes
+        """
+        filename = 'selfplay.pth.tar'
+        self.nnet.save_checkpoint(folder=self.args.checkpoint, filename=filename)
+        # with args.selfPlayStartMethod 'fork', forking while the writer thread is inside the deep learning
+        # framework could deadlock the workers
+        self.flushCheckpoints()
+        # args.selfPlayStartMethod is 'spawn' (default), 'forkserver' or 'fork'
+        context = processContext(self.args.get('selfPlayStartMethod'))
+        table = None
+        if self.args.get('sharedEvalSlots'):
+            table = SharedEvalTable(self.game.getActionSize(), self.args.sharedEvalSlots, context=context)
+        initargs = (self.game, self.nnet.__class__, self.args, self.args.checkpoint, filename)
+        tasks = [(iteration, episode, games[episode]) for episode in range(self.args.numEps)]
+        try:
+            if not self.args.get('inferenceServer'):
+                with context.Pool(workers, initializer=initSelfPlayWorker,
+                                  initargs=initargs + (None, None, table)) as pool:
+                    results = list(tqdm(pool.imap(playSelfPlayEpisode, tasks), total=len(tasks), desc="Self Play"))
+            else:
+                with InferenceServer(self.game, self.nnet.__class__, self.args.checkpoint, filename, workers,
+                                     max_batch_size=workers, max_wait=self.args.get('inferenceMaxWait') or 0.002,
+                                     context=context) as server:
+                    slots = context.Queue()  # every worker takes the pipe of one slot
+                    for slot in range(workers):
+                        slots.put(slot)
+                    with context.Pool(workers, initializer=initSelfPlayWorker,
+                                      initargs=initargs + (server.clients, slots, table)) as pool:
+                        results = list(tqdm(pool.imap(playSelfPlayEpisode, tasks), total=len(tasks),
+                                            desc="Self Play"))
+                log.info('Inference server stats:\n' + formatStats(server.stats))
+            if table is not None:
+                usage = table.usage(checkpointVersion(self.args.checkpoint, filename))
+                log.info(f'Shared evaluation table: {usage}/{table.slots} slots used')
+        finally:
+            if table is not None:
+                table.close()
+        return [examples for examples, _ in results], [game for _, game in results]
+
+    def selfPlayBatched(self, iteration, games):
+        """
+        Plays the numEps self-play episodes of an iteration in this process,
+        args.selfPlayBatchSize of them at once, each with its own search tree.
+        The leaves of all running episodes are evaluated together with
+        predict_batch (see MCTS.runBatched).
+
+        The episodes share the random generators, so with args.seed set the
+        iteration as a whole is reproducible, but an episode differs from the
+        one playEpisode would play.
+
+        Returns:
+            examples: list of CompactExamples, one per episode
+        """
+        if self.args.get('seed') is not None:
+            seed = np.random.SeedSequence([self.args.seed, iteration]).generate_state(1)[0]
+            np.random.seed(seed)
+            random.seed(int(seed))
+        tasks = [self.episodeSteps(MCTS(self.game, self.nnet, self.args), game) for game in games]
+        with tqdm(total=len(tasks), desc="Self Play") as progress:
+            episodes = runBatched(tasks, self.args.selfPlayBatchSize, callback=lambda i, result: progress.update())
+        return [self.compactExamples(examples) for examples in episodes]
+
+    def playEpisode(self, iteration, episode, resign=None):
+        """
+        Plays one self-play episode with a fresh search tree, resigning as
+        decided by the ResignGame resign if given.
+
+        If args.seed is set, the random generators are seeded from (seed,
+        iteration, episode), which makes the episode reproducible no matter in
+        which process it is played.
+
+        Returns:
+            examples: CompactExamples of the episode
+        """
+        if self.args.get('seed') is not None:
+            seed = np.random.SeedSequence([self.args.seed, iteration, episode]).generate_state(1)[0]
+            np.random.seed(seed)
+            random.seed(int(seed))
+        self.mcts = MCTS(self.game, self.nnet, self.args)  # reset search tree
+        return self.compactExamples(runSteps(self.episodeSteps(self.mcts, resign)))
+
+    def compactExamples(self, examples):
+        """
+        Converts a list of (board, pi, v) examples to CompactExamples.
+        """
+        return CompactExamples.fromExamples(examples, self.game.getActionSize())
 
     def getCheckpointFile(self, iteration):
         return 'checkpoint_' + str(iteration) + '.pth.tar'
 
     def saveTrainExamples(self, iteration):
-        folder = self.args.checkpoint
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-        filename = os.path.join(folder, self.getCheckpointFile(iteration) + ".examples")
-        with open(filename, "wb+") as f:
-            Pickler(f).dump(self.trainExamplesHistory)
-        f.closed
+        """
+        Writes the examples of the current iteration as a new replay store
+        segment and shrinks the store's window to the history. Only the new
+        examples are written, older segments are never rewritten.
+        """
+        if self.newTrainExamples is not None:
+            self.replayStore.append(self.newTrainExamples)
+            self.newTrainExamples = None
+        if self.replayBuffer is not None:
+            self.replayStore.keepLatest(self.args.numItersForTrainExamplesHistory)
+        else:
+            self.replayStore.keepLatest(len(self.trainExamplesHistory))
 
     def loadTrainExamples(self):
+        """
+        Loads the history from the replay store in load_folder_file[0] (memory
+        mapped), or from a pickled <model file>.examples of older versions.
+        """
+        store = ReplayStore(os.path.join(self.args.load_folder_file[0], 'replay'))
+        if store.exists():
+            log.info(f'Replay store with {len(store.segments)} segments found. Loading it...')
+            history = store.load()
+            if os.path.abspath(store.folder) != os.path.abspath(self.replayStore.folder):
+                # continue in a store of our own
+                for examples in history:
+                    self.replayStore.append(examples)
+            self.restoreTrainExamples(history)
+            log.info('Loading done!')
+            self.skipFirstSelfPlay = True
+            return
+
         modelFile = os.path.join(self.args.load_folder_file[0], self.args.load_folder_file[1])
         examplesFile = modelFile + ".examples"
         if not os.path.isfile(examplesFile):
@@ -150,8 +787,109 @@ class Coach():
         else:
             log.info("File with trainExamples found. Loading it...")
             with open(examplesFile, "rb") as f:
-                self.trainExamplesHistory = Unpickler(f).load()
+                history = Unpickler(f).load()
+            # histories saved before the compact format hold lists of (board, pi, v) tuples
+            history = [e if isinstance(e, CompactExamples) else self.compactExamples(list(e)) for e in history]
+            for examples in history:
+                self.replayStore.append(examples)
+            self.restoreTrainExamples(history)
             log.info('Loading done!')
 
             # examples based on the model were already collected (loaded)
             self.skipFirstSelfPlay = True
+
+    def restoreTrainExamples(self, history):
+        """
+        Adds a loaded history, oldest first. Its last entry stands in for the
+        self-play of iteration 1, which is skipped after loading.
+        """
+        self.trainExamplesHistory = []
+        for iteration, examples in enumerate(history, start=2 - len(history)):
+            self.addTrainExamples(examples, iteration)
+
+
+class SelfPlayWorker():
+    """
+    Plays self-play episodes in a process of Coach's self-play pool, using
+    Coach's episode logic without building a competitor network or a replay
+    store.
+    """
+
+    def __init__(self, game, nnet, args):
+        self.game = game
+        self.nnet = nnet
+        self.args = args
+
+    executeEpisode = Coach.executeEpisode
+    episodeSteps = Coach.episodeSteps
+    playEpisode = Coach.playEpisode
+    compactExamples = Coach.compactExamples
+
+
+selfPlayWorker = None  # the SelfPlayWorker of a pool process
+
+
+def initSelfPlayWorker(game, nnet_class, args, folder, filename, clients=None, slots=None, table=None):
+    global selfPlayWorker
+    # forked workers inherit the parent's random state, give every worker its own
+    np.random.seed()
+    random.seed()
+    if clients is not None:
+        nnet = RemoteNNetWrapper(clients[slots.get()])
+    else:
+        if 'torch' in sys.modules:
+            # the workers already use all cores, more threads per worker only compete for them
+            sys.modules['torch'].set_num_threads(1)
+        nnet = nnet_class(game)
+        nnet.load_checkpoint(folder=folder, filename=filename)
+    if table is not None:
+        nnet = SharedCacheNNet(nnet, table, checkpointVersion(folder, filename))
+    selfPlayWorker = SelfPlayWorker(game, nnet, args)
+
+
+def playSelfPlayEpisode(task):
+    """
+    Plays episode (iteration, episode, resign) in a worker.
+
+    Returns:
+        examples: CompactExamples of the episode
+        resign: the finished ResignGame, which does not come back by itself
+    """
+    iteration, episode, resign = task
+    return selfPlayWorker.playEpisode(iteration, episode, resign), resign
+
+
+def getPublishedFile(number):
+    return 'published_' + str(number) + '.pth.tar'
+
+
+def runActor(game, nnet_class, args, version, queue, stop, actor, resignation=None, threshold=None):
+    """
+    Main loop of an actor process of Coach.learnAsync: loads the latest
+    published weights between games and plays episodes until stop is set.
+    With args.seed set, episode n of the actor is seeded from (seed, actor, n).
+    With a Resignation, games resign at the shared threshold's current value.
+    """
+    np.random.seed()
+    random.seed()
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(1)
+    worker = SelfPlayWorker(game, nnet_class(game), args)
+    loaded = None
+    episode = 0
+    while not stop.is_set():
+        if version.value != loaded:
+            loaded = version.value
+            worker.nnet.load_checkpoint(folder=args.checkpoint, filename=getPublishedFile(loaded))
+        resign = None
+        if resignation is not None:
+            resignation.threshold = threshold.value
+            resign = resignation.newGame()
+        item = (loaded, worker.playEpisode(actor, episode, resign), resign)
+        episode += 1
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=1)
+                break
+            except Full:
+                pass
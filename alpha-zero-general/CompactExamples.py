@@ -0,0 +1,234 @@
+import numpy as np
+
+
+def compactDtype(array):
+    """
+    Returns the smallest integer dtype that holds all values of an integer
+    array (uint8 for LKID boards), or the array's own dtype otherwise.
+    """
+    if array.dtype.kind not in 'biu' or array.size == 0:
+        return array.dtype
+    low, high = array.min(), array.max()
+    for dtype in (np.uint8, np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return array.dtype
+
+
+class CompactExamples():
+    """
+    Columnar, compact storage for training examples of the form (board, pi, v).
+
+    boards are stored in the smallest integer dtype that holds them, values as
+    float32 and policies sparsely: only the non-zero entries of each pi are
+    kept, as action indices (uint16 when the action space allows it) and
+    probabilities (float16 by default). Example i owns the entries
+    offsets[i]:offsets[i+1] of actions and probs.
+
+    weights counts how many original examples an example stands for (1 unless
+    the examples were aggregated, see aggregate) and is used as sample weight
+    in training.
+
+    Indexing and iterating return (board, pi, v) with a dense pi that is built
+    on demand, so a CompactExamples can be passed to any NNetWrapper.train.
+    batch() builds dense training batches for many examples at once.
+    """
+
+    def __init__(self, boards, offsets, actions, probs, values, action_size, weights=None):
+        self.boards = boards
+        self.offsets = offsets
+        self.actions = actions
+        self.probs = probs
+        self.values = values
+        self.action_size = action_size
+        self.weights = np.ones(len(values), dtype=np.float32) if weights is None else weights
+
+    @classmethod
+    def fromExamples(cls, examples, action_size, prob_dtype=np.float16):
+        """
+        Input:
+            examples: list of (board, pi, v), pi either a dense policy vector
+                      or a sparse (actions, probs) pair
+            action_size: length of the dense policy vectors
+            prob_dtype: dtype used to store the policy probabilities
+        """
+        boards = np.array([board for board, _, _ in examples])
+        boards = boards.astype(compactDtype(boards), copy=False)
+        values = np.array([v for _, _, v in examples], dtype=np.float32)
+
+        actions, probs = [], []
+        for _, pi, _ in examples:
+            if isinstance(pi, tuple):
+                pi_actions, pi_probs = pi
+            else:
+                pi = np.asarray(pi)
+                pi_actions = np.flatnonzero(pi)
+                pi_probs = pi[pi_actions]
+            actions.append(pi_actions)
+            probs.append(pi_probs)
+
+        offsets = np.zeros(len(examples) + 1, dtype=np.int64)
+        np.cumsum([len(a) for a in actions], out=offsets[1:])
+        action_dtype = np.uint16 if action_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+        actions = np.concatenate(actions).astype(action_dtype) if actions else np.zeros(0, action_dtype)
+        probs = np.concatenate(probs).astype(prob_dtype) if probs else np.zeros(0, prob_dtype)
+        return cls(boards, offsets, actions, probs, values, action_size)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """
+        Concatenates a non-empty list of CompactExamples.
+        """
+        offsets = [np.zeros(1, dtype=np.int64)]
+        shift = 0
+        for part in parts:
+            offsets.append(part.offsets[1:] + shift)
+            shift += part.offsets[-1]
+        return cls(np.concatenate([part.boards for part in parts]),
+                   np.concatenate(offsets),
+                   np.concatenate([part.actions for part in parts]),
+                   np.concatenate([part.probs for part in parts]),
+                   np.concatenate([part.values for part in parts]),
+                   parts[0].action_size,
+                   np.concatenate([part.weights for part in parts]))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        board, (actions, probs), v = self.sparse(i)
+        pi = np.zeros(self.action_size, dtype=np.float32)
+        pi[actions] = probs
+        return board, pi, v
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def sparse(self, i):
+        """
+        Returns example i as (board, (actions, probs), v).
+        """
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.boards[i], (self.actions[start:end], self.probs[start:end]), self.values[i]
+
+    def gather(self, indices):
+        """
+        Returns, for the examples at indices, the positions of their policy
+        entries in actions/probs and the offsets of the gathered policies.
+        """
+        starts = self.offsets[indices]
+        lengths = self.offsets[np.asarray(indices) + 1] - starts
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return positions, offsets
+
+    def take(self, indices):
+        """
+        Returns a new CompactExamples with the examples at indices, in that order.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        positions, offsets = self.gather(indices)
+        return CompactExamples(self.boards[indices], offsets, self.actions[positions], self.probs[positions],
+                               self.values[indices], self.action_size, self.weights[indices])
+
+    def tail(self, n):
+        """
+        Returns the n most recent examples.
+        """
+        return self.take(np.arange(max(0, len(self) - n), len(self)))
+
+    def withTargets(self, indices, policies, values=None):
+        """
+        Returns a new CompactExamples in which the examples at indices have new
+        targets.
+
+        Input:
+            indices: distinct indices of the examples to change
+            policies: their new sparse policies, (actions, probs) pairs
+            values: their new values, or None to keep the old ones
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        replaced = np.zeros(len(self), dtype=bool)
+        replaced[indices] = True
+        lengths = np.diff(self.offsets)
+        old_rows = np.repeat(np.arange(len(self)), lengths)
+        keep = ~replaced[old_rows]
+        new_lengths = np.array([len(actions) for actions, _ in policies], dtype=np.int64)
+        new_rows = np.repeat(indices, new_lengths)
+        new_actions = np.concatenate([actions for actions, _ in policies]) if policies else np.zeros(0)
+        new_probs = np.concatenate([probs for _, probs in policies]) if policies else np.zeros(0)
+
+        # merge the kept and the new policy entries in example order
+        rows = np.concatenate([old_rows[keep], new_rows])
+        order = np.argsort(rows, kind='stable')
+        actions = np.concatenate([self.actions[keep], new_actions.astype(self.actions.dtype)])[order]
+        probs = np.concatenate([self.probs[keep], new_probs.astype(self.probs.dtype)])[order]
+        lengths = np.where(replaced, 0, lengths)
+        lengths[indices] = new_lengths
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        new_values = np.array(self.values)
+        if values is not None:
+            new_values[indices] = values
+        return CompactExamples(np.asarray(self.boards), offsets, actions, probs, new_values, self.action_size,
+                               np.array(self.weights))
+
+    def batch(self, indices):
+        """
+        Builds dense arrays for the examples at indices.
+
+        Returns:
+            boards: the stored boards
+            pis: float32 array of shape (len(indices), action_size)
+            vs: float32 array of shape (len(indices),)
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        positions, offsets = self.gather(indices)
+        rows = np.repeat(np.arange(len(indices)), np.diff(offsets))
+        pis = np.zeros((len(indices), self.action_size), dtype=np.float32)
+        pis[rows, self.actions[positions]] = self.probs[positions]
+        return self.boards[indices], pis, self.values[indices]
+
+    def sampleWeights(self, indices):
+        return self.weights[indices]
+
+    def aggregate(self):
+        """
+        Merges examples with identical boards (the boards are canonical, so
+        their bytes are the canonical state hash) into one example whose policy
+        and value are the weighted averages of the merged targets and whose
+        weight is the sum of their weights.
+
+        Returns:
+            unique: CompactExamples with one example per distinct board
+        """
+        rows = np.ascontiguousarray(self.boards.reshape(len(self), -1))
+        keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+        _, first, group = np.unique(keys, return_index=True, return_inverse=True)
+        group = group.ravel()
+        groups = len(first)
+        weights = np.bincount(group, weights=self.weights, minlength=groups)
+        values = np.bincount(group, weights=self.weights * self.values, minlength=groups) / weights
+
+        # sum the weighted policy entries per (group, action)
+        lengths = np.diff(self.offsets)
+        entry_weights = np.repeat(self.weights, lengths)
+        entry_keys = np.repeat(group, lengths).astype(np.int64) * self.action_size + self.actions
+        entry_keys, entry_group = np.unique(entry_keys, return_inverse=True)
+        probs = np.bincount(entry_group.ravel(), weights=entry_weights * self.probs, minlength=len(entry_keys))
+        probs_group = entry_keys // self.action_size
+        probs /= weights[probs_group]
+
+        offsets = np.zeros(groups + 1, dtype=np.int64)
+        np.cumsum(np.bincount(probs_group, minlength=groups), out=offsets[1:])
+        return CompactExamples(self.boards[first], offsets, (entry_keys % self.action_size).astype(self.actions.dtype),
+                               probs.astype(self.probs.dtype), values.astype(np.float32), self.action_size,
+                               weights.astype(np.float32))
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.boards, self.offsets, self.actions, self.probs, self.values, self.weights))
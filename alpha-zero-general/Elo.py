@@ -0,0 +1,55 @@
+import math
+
+import numpy as np
+
+ELO_PER_NAT = 400 / math.log(10)
+
+
+def fitElo(names, pairings, prior=0.01, iterations=100):
+    """
+    Fits Elo ratings to match results by maximum likelihood (Bradley-Terry
+    model, a draw counts as half a win for both players).
+
+    A weak Gaussian prior (of precision prior, in squared natural units) keeps
+    the ratings finite for players that won or lost all of their games and
+    centers them around 0.
+
+    Input:
+        names: list of player names
+        pairings: list of (name1, name2, wins1, wins2, draws)
+
+    Returns:
+        ratings: dict name -> (elo, ci), ci being the half width of the 95%
+                 confidence interval
+    """
+    index = {name: i for i, name in enumerate(names)}
+    n = len(names)
+    rows = np.array([(index[a], index[b]) for a, b, _, _, _ in pairings], dtype=np.int64).reshape(-1, 2)
+    games = np.array([w1 + w2 + d for _, _, w1, w2, d in pairings], dtype=np.float64)
+    scores = np.array([w1 + d / 2 for _, _, w1, _, d in pairings], dtype=np.float64)
+
+    r = np.zeros(n)
+    hessian = prior * np.eye(n)
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(r[rows[:, 1]] - r[rows[:, 0]]))
+        residual = scores - games * p
+        gradient = -prior * r
+        np.add.at(gradient, rows[:, 0], residual)
+        np.add.at(gradient, rows[:, 1], -residual)
+
+        # negative hessian of the log likelihood
+        weight = games * p * (1 - p)
+        hessian = prior * np.eye(n)
+        np.add.at(hessian, (rows[:, 0], rows[:, 0]), weight)
+        np.add.at(hessian, (rows[:, 1], rows[:, 1]), weight)
+        np.add.at(hessian, (rows[:, 0], rows[:, 1]), -weight)
+        np.add.at(hessian, (rows[:, 1], rows[:, 0]), -weight)
+
+        step = np.linalg.solve(hessian, gradient)
+        r += step
+        if np.max(np.abs(step)) < 1e-9:
+            break
+
+    ci = 1.96 * np.sqrt(np.diag(np.linalg.inv(hessian)))
+    r -= r.mean()
+    return {name: (r[i] * ELO_PER_NAT, ci[i] * ELO_PER_NAT) for name, i in index.items()}
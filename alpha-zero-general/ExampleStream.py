@@ -0,0 +1,133 @@
+import math
+
+import numpy as np
+
+
+class ExampleStream():
+    """
+    Feeds training examples to model.fit one minibatch at a time. Only a single
+    batch of boards and dense policy vectors exists at any moment instead of the
+    whole (possibly several GB) example history.
+
+    The examples come either from one sequence (the list built by Coach, or
+    anything else supporting len() and indexing) or from several segments
+    streamed one after the other, e.g. the memory-mapped segments of a
+    ReplayStore (see fromReplayStore), so only the pages of the current batch
+    are read from disk. Each example is of the form (board, pi, v), where pi is
+    either a dense policy vector or a sparse (actions, probs) pair that is
+    expanded to a dense vector per batch.
+
+    Examples with sample weights (CompactExamples, ReplayBuffer) additionally
+    yield the weights, scaled to a mean of 1 over all examples so the loss keeps
+    its scale.
+    """
+
+    def __init__(self, examples=None, segments=None, action_size=None, batch_size=64, shuffle=True, transform=None):
+        """
+        Input:
+            examples: sequence of examples (exclusive with segments)
+            segments: list of sequences of examples (exclusive with examples)
+            action_size: length of the dense policy vectors
+            batch_size: number of examples per batch
+            shuffle: shuffle the examples (within a segment) on every pass
+            transform: optional function applied to every batch of boards,
+                       e.g. an input encoder. Must return the new boards.
+        """
+        assert (examples is None) != (segments is None), 'pass either examples or segments'
+        self.segments = [examples] if segments is None else [segment for segment in segments if len(segment)]
+        self.action_size = action_size
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.transform = transform
+
+        self.sizes = [len(segment) for segment in self.segments]
+        if sum(self.sizes) == 0:
+            raise ValueError('ExampleStream needs at least one example')
+
+        self.weightScale = None
+        if all(hasattr(segment, 'sampleWeights') for segment in self.segments):
+            weights = sum(np.sum(segment.sampleWeights(np.arange(len(segment))), dtype=np.float64)
+                          for segment in self.segments)
+            self.weightScale = sum(self.sizes) / weights
+
+    @classmethod
+    def fromReplayStore(cls, store, **kwargs):
+        """
+        Returns a stream of the segments in the window of ReplayStore store.
+        """
+        return cls(segments=store.load(), **kwargs)
+
+    def __len__(self):
+        """
+        Returns:
+            steps: number of batches in one pass over all examples
+        """
+        return sum(math.ceil(size / self.batch_size) for size in self.sizes)
+
+    def __iter__(self):
+        """
+        Yields (boards, (pis, vs)) or, for weighted examples, (boards, (pis, vs),
+        weights) batches forever, one pass after the other, as expected by
+        model.fit together with steps_per_epoch=len(stream).
+        """
+        while True:
+            for examples in self.chunks():
+                if self.shuffle:
+                    order = np.random.permutation(len(examples))
+                else:
+                    order = np.arange(len(examples))
+                for start in range(0, len(examples), self.batch_size):
+                    yield self.makeBatch(examples, order[start:start + self.batch_size])
+
+    def chunks(self):
+        order = np.random.permutation(len(self.segments)) if self.shuffle else range(len(self.segments))
+        for i in order:
+            yield self.segments[i]
+
+    def makeBatch(self, examples, ids):
+        """
+        Builds the dense arrays for examples[ids].
+
+        Returns:
+            boards: array of the boards (after transform)
+            (pis, vs): float32 arrays with the dense policies and the values
+        """
+        if hasattr(examples, 'batch'):
+            # CompactExamples expand their sparse policies for the whole batch at once
+            boards, pis, vs = examples.batch(ids)
+        else:
+            boards = np.asarray([examples[i][0] for i in ids])
+            pis = np.zeros((len(ids), self.action_size), dtype=np.float32)
+            vs = np.empty(len(ids), dtype=np.float32)
+            for row, i in enumerate(ids):
+                _, pi, v = examples[i]
+                if isinstance(pi, tuple):
+                    actions, probs = pi
+                    pis[row, actions] = probs
+                else:
+                    pis[row] = pi
+                vs[row] = v
+
+        if self.transform is not None:
+            boards = self.transform(boards)
+        if self.weightScale is not None:
+            weights = (examples.sampleWeights(ids) * self.weightScale).astype(np.float32)
+            return boards, (pis, vs), weights
+        return boards, (pis, vs)
+
+    def dataset(self):
+        """
+        Wraps the stream into a prefetching tf.data.Dataset, so the next batches
+        are built while the model trains on the current one.
+        """
+        import tensorflow as tf
+
+        batch = next(iter(self))
+
+        def spec(array):
+            return tf.TensorSpec(shape=(None,) + array.shape[1:], dtype=array.dtype)
+
+        boards, (pis, vs) = batch[:2]
+        signature = (spec(boards), (spec(pis), spec(vs))) + tuple(spec(weights) for weights in batch[2:])
+        dataset = tf.data.Dataset.from_generator(lambda: iter(self), output_signature=signature)
+        return dataset.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class GameCache():
+    """
+    Content-addressed store of Arena game results. A game is identified by the
+    keys of its players and its start position, so it only suits players that
+    play the same game from the same start, like MCTS players with a fresh
+    tree per game and temp=0 (up to ties between equally visited moves).
+
+    The results are kept in memory and, if path is given, in a JSON file
+    there, which is read on creation and rewritten on every new result.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.isfile(path):
+            with open(path) as f:
+                self.results = json.load(f)
+
+    @staticmethod
+    def key(playerKeys, start):
+        """
+        Input:
+            playerKeys: keys of the players playing as 1 and as -1
+            start: (board, curPlayer) the game starts from
+
+        Returns:
+            key: hex digest identifying the game
+        """
+        board, curPlayer = start
+        digest = hashlib.sha1(json.dumps([list(playerKeys), int(curPlayer)]).encode())
+        digest.update(np.ascontiguousarray(board).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the stored result of game key (from the perspective of player
+        1), or None.
+        """
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self.results[key] = float(result)
+        if self.path is not None:
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.results, f)
+            os.replace(self.path + '.tmp', self.path)
+
+
+def checkpointHash(folder, filename):
+    """
+    Returns a hash of the contents of checkpoint folder/filename, i.e. of all
+    files in folder whose names start with its base name (the networks may
+    store a checkpoint under a derived name, e.g. with a .weights.h5 suffix).
+    """
+    digest = hashlib.sha1()
+    prefix = filename.split('.')[0] + '.'
+    for name in sorted(os.listdir(folder or '.')):
+        if name.startswith(prefix):
+            with open(os.path.join(folder, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
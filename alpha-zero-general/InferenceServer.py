@@ -0,0 +1,181 @@
+import logging
+import time
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from NeuralNet import PredictionNet
+from utils import processContext
+
+log = logging.getLogger(__name__)
+
+LATENCY_BINS = 2. ** np.arange(-4, 11)  # histogram bin edges in milliseconds, 1/16 ms to 1 s
+
+
+class InferenceServer():
+    """
+    Runs one copy of a neural network in a separate process and evaluates the
+    boards of many self-play workers in dynamic batches.
+
+    Every client owns one end of a pipe and sends one request at a time: a
+    stacked array of canonical boards. The server collects requests until
+    max_batch_size boards are pending, every client is waiting or the oldest
+    request has waited max_wait seconds, evaluates all pending boards with a
+    single predict_batch and sends every client its rows back.
+
+    Clients use the network through RemoteNNetWrapper, which implements the
+    NeuralNet interface, so MCTS works with it unchanged.
+    """
+
+    def __init__(self, game, nnet_class, folder, filename, num_clients, max_batch_size=256, max_wait=0.002,
+                 context=None):
+        """
+        Input:
+            game: Game object
+            nnet_class: NeuralNet class of the served network
+            folder, filename: checkpoint loaded by the server
+            num_clients: number of client pipes to create
+            max_batch_size: number of pending boards that triggers a forward pass
+            max_wait: seconds a request may wait for other requests to batch with
+            context: multiprocessing context to start the server process with
+        """
+        context = context or processContext()
+        self.clients = []  # client ends of the pipes, one per client
+        server_ends = []
+        for _ in range(num_clients):
+            client_end, server_end = context.Pipe()
+            self.clients.append(client_end)
+            server_ends.append(server_end)
+        self.control, server_control = context.Pipe()
+        self.stats = None
+
+        self.process = context.Process(target=serve, daemon=True,
+                                       args=(game, nnet_class, folder, filename, server_ends, server_control,
+                                             max_batch_size, max_wait))
+        self.process.start()
+        self.checkReply()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def client(self, i):
+        return RemoteNNetWrapper(self.clients[i])
+
+    def load(self, folder, filename):
+        """
+        Loads another checkpoint into the served network. Requests that are
+        already pending are evaluated with the old weights first.
+        """
+        self.control.send(('load', folder, filename))
+        self.checkReply()
+
+    def stop(self):
+        """
+        Stops the server after answering the pending requests.
+
+        Returns:
+            stats: the batch size and latency histograms, see formatStats
+        """
+        if self.stats is None:
+            self.control.send(('stop',))
+            self.stats = self.control.recv()
+            self.process.join()
+        return self.stats
+
+    def checkReply(self):
+        error = self.control.recv()
+        if error is not None:
+            self.process.join()
+            raise RuntimeError(f'Inference server failed: {error}')
+
+
+class RemoteNNetWrapper(PredictionNet):
+    """
+    Client stub of an InferenceServer. It only predicts; the served network
+    is trained and checkpointed by its owner, and loads new weights through
+    InferenceServer.load.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def predict(self, board):
+        pis, vs = self.predict_batch(np.asarray(board)[np.newaxis])
+        return pis[0], vs[0]
+
+    def predict_batch(self, boards):
+        self.connection.send(np.asarray(boards))
+        return self.connection.recv()
+
+
+def serve(game, nnet_class, folder, filename, connections, control, max_batch_size, max_wait):
+    """
+    Main loop of the server process, see InferenceServer.
+    """
+    try:
+        nnet = nnet_class(game)
+        nnet.load_checkpoint(folder=folder, filename=filename)
+    except Exception as e:
+        control.send(repr(e))
+        return
+    control.send(None)
+
+    batch_sizes = np.zeros(max_batch_size + 1, dtype=np.int64)
+    latencies = np.zeros(len(LATENCY_BINS) + 1, dtype=np.int64)  # last bin counts everything slower
+    pending = []  # (connection, boards, arrival time) of the requests waiting for evaluation
+    open_connections = list(connections)
+
+    def evaluate():
+        pis, vs = nnet.predict_batch(np.concatenate([boards for _, boards, _ in pending]))
+        start = 0
+        now = time.perf_counter()
+        for connection, boards, arrival in pending:
+            connection.send((pis[start:start + len(boards)], vs[start:start + len(boards)]))
+            start += len(boards)
+            latencies[np.searchsorted(LATENCY_BINS, (now - arrival) * 1000)] += 1
+        batch_sizes[min(start, max_batch_size)] += 1
+        pending.clear()
+
+    while True:
+        timeout = None
+        if pending:
+            timeout = max(0., pending[0][2] + max_wait - time.perf_counter())
+        for connection in wait(open_connections + [control], timeout):
+            if connection is control:
+                command = control.recv()
+                if pending:
+                    evaluate()
+                if command[0] == 'stop':
+                    control.send({'batch_sizes': batch_sizes, 'latency_bins': LATENCY_BINS, 'latencies': latencies})
+                    return
+                try:
+                    nnet.load_checkpoint(folder=command[1], filename=command[2])
+                    control.send(None)
+                except Exception as e:
+                    control.send(repr(e))
+                continue
+            try:
+                pending.append((connection, connection.recv(), time.perf_counter()))
+            except EOFError:
+                open_connections.remove(connection)
+
+        if pending and (sum(len(boards) for _, boards, _ in pending) >= max_batch_size
+                        or len(pending) == len(open_connections)
+                        or time.perf_counter() >= pending[0][2] + max_wait):
+            evaluate()
+
+
+def formatStats(stats):
+    """
+    Returns the histograms of InferenceServer.stop as a printable string.
+    """
+    sizes = np.flatnonzero(stats['batch_sizes'])
+    lines = ['Batch sizes: ' + ', '.join(f'{size}: {stats["batch_sizes"][size]}' for size in sizes)]
+    bins = stats['latency_bins']
+    labels = [f'<{edge:g}ms' for edge in bins] + [f'>={bins[-1]:g}ms']
+    lines.append('Latencies: ' + ', '.join(f'{label}: {count}'
+                                           for label, count in zip(labels, stats['latencies']) if count))
+    return '\n'.join(lines)
@@ -3,10 +3,16 @@ import math
 
 import numpy as np
 
+from NeuralNet import getModelVersion
+from utils import LRUCache
+
 EPS = 1e-8
 
 log = logging.getLogger(__name__)
 
+# network evaluations of leaves shared by the MCTS instances of a process, see MCTS.__init__
+evalCache = LRUCache(0)
+
 
 class MCTS():
     """
@@ -25,20 +31,43 @@ class MCTS():
         self.Es = {}  # stores game.getGameEnded ended for board s
         self.Vs = {}  # stores game.getValidMoves for board s
 
-    def getActionProb(self, canonicalBoard, temp=1):
+        # with args.evalCacheSize set, leaf evaluations (masked policy and value) are kept in evalCache, keyed
+        # by the model version and s, so a new tree does not evaluate the positions earlier trees did again
+        self.cache = None
+        if args.get('evalCacheSize'):
+            self.cache = evalCache
+            if evalCache.capacity != args.evalCacheSize:
+                evalCache.resize(args.evalCacheSize)
+
+        # with args.openingBook set, the positions in that OpeningBook are answered from it instead of searched
+        self.book = None
+        if args.get('openingBook'):
+            from OpeningBook import getBook
+            self.book = getBook(game, args.openingBook)
+
+    def getActionProb(self, canonicalBoard, temp=1, numSims=None):
         """
         This function performs numMCTSSims simulations of MCTS starting from
-        canonicalBoard.
+        canonicalBoard (or numSims, if given).
 
         Returns:
             probs: a policy vector where the probability of the ith action is
                    proportional to Nsa[(s,a)]**(1./temp)
         """
-        for i in range(self.args.numMCTSSims):
-            self.search(canonicalBoard)
+        return runSteps(self.getActionProbSteps(canonicalBoard, temp=temp, numSims=numSims))
 
-        s = self.game.stringRepresentation(canonicalBoard)
-        counts = [self.Nsa[(s, a)] if (s, a) in self.Nsa else 0 for a in range(self.game.getActionSize())]
+    def getActionProbSteps(self, canonicalBoard, temp=1, numSims=None):
+        """
+        Step generator version of getActionProb, see searchSteps. Positions in
+        the opening book take its visit distribution instead of a search.
+        """
+        counts = self.book.lookup(canonicalBoard) if self.book is not None else None
+        if counts is None:
+            for i in range(self.args.numMCTSSims if numSims is None else numSims):
+                yield from self.searchSteps(canonicalBoard)
+
+            s = self.game.stringRepresentation(canonicalBoard)
+            counts = [self.Nsa[(s, a)] if (s, a) in self.Nsa else 0 for a in range(self.game.getActionSize())]
 
         if temp == 0:
             bestAs = np.array(np.argwhere(counts == np.max(counts))).flatten()
@@ -52,6 +81,25 @@ class MCTS():
         probs = [x / counts_sum for x in counts]
         return probs
 
+    def bestActionSteps(self, canonicalBoard):
+        """
+        Step generator that returns np.argmax(getActionProb(canonicalBoard,
+        temp=0)), usable as an Arena player.
+        """
+        probs = yield from self.getActionProbSteps(canonicalBoard, temp=0)
+        return np.argmax(probs)
+
+    def rootValue(self, canonicalBoard):
+        """
+        Returns the value of canonicalBoard for the player to move estimated
+        by the searches so far: the mean of the Q values of its moves, weighted
+        by their visit counts (0 before any move was visited).
+        """
+        s = self.game.stringRepresentation(canonicalBoard)
+        visits = [(self.Nsa[(s, a)], self.Qsa[(s, a)]) for a in range(self.game.getActionSize()) if (s, a) in self.Nsa]
+        total = sum(n for n, _ in visits)
+        return sum(n * q for n, q in visits) / total if total else 0
+
     def search(self, canonicalBoard):
         """
         This function performs one iteration of MCTS. It is recursively called
@@ -71,6 +119,15 @@ class MCTS():
         Returns:
             v: the negative of the value of the current canonicalBoard
         """
+        return runSteps(self.searchSteps(canonicalBoard))
+
+    def searchSteps(self, canonicalBoard):
+        """
+        Step generator version of search. Instead of calling the neural network
+        for a leaf, it yields (nnet, canonicalBoard) and expects (pi, v) to be
+        sent back. This lets runBatched evaluate the leaves of many searches in
+        one batch. The generator returns what search returns.
+        """
 
         s = self.game.stringRepresentation(canonicalBoard)
 
@@ -82,7 +139,18 @@ class MCTS():
 
         if s not in self.Ps:
             # leaf node
-            self.Ps[s], v = self.nnet.predict(canonicalBoard)
+            key = (getModelVersion(self.nnet), s) if self.cache is not None else None
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                actions, probs, v = cached
+                self.Ps[s] = np.zeros(self.game.getActionSize())
+                self.Ps[s][actions] = probs
+                self.Vs[s] = np.zeros(self.game.getActionSize())
+                self.Vs[s][actions] = 1
+                self.Ns[s] = 0
+                return -v
+
+            self.Ps[s], v = yield self.nnet, canonicalBoard
             valids = self.game.getValidMoves(canonicalBoard, 1)
             self.Ps[s] = self.Ps[s] * valids  # masking invalid moves
             sum_Ps_s = np.sum(self.Ps[s])
@@ -99,6 +167,9 @@ class MCTS():
 
             self.Vs[s] = valids
             self.Ns[s] = 0
+            if key is not None:
+                actions = np.flatnonzero(valids)
+                self.cache.put(key, (actions, self.Ps[s][actions].astype(np.float32), v))
             return -v
 
         valids = self.Vs[s]
@@ -122,7 +193,7 @@ class MCTS():
         next_s, next_player = self.game.getNextState(canonicalBoard, 1, a)
         next_s = self.game.getCanonicalForm(next_s, next_player)
 
-        v = self.search(next_s)
+        v = yield from self.searchSteps(next_s)
 
         if (s, a) in self.Qsa:
             self.Qsa[(s, a)] = (self.Nsa[(s, a)] * self.Qsa[(s, a)] + v) / (self.Nsa[(s, a)] + 1)
@@ -134,3 +205,82 @@ class MCTS():
 
         self.Ns[s] += 1
         return -v
+
+
+def runSteps(steps):
+    """
+    Runs a step generator (see MCTS.searchSteps) to its end, evaluating every
+    requested leaf with nnet.predict.
+
+    Returns:
+        result: the return value of the generator
+    """
+    try:
+        request = next(steps)
+        while True:
+            nnet, board = request
+            request = steps.send(nnet.predict(board))
+    except StopIteration as stop:
+        return stop.value
+
+
+def runBatched(tasks, batch_size, callback=None, stop=None):
+    """
+    Runs many step generators (e.g. one per game, each with its own MCTS)
+    concurrently, batch_size of them at a time. The generators are advanced
+    until each of them waits for a leaf evaluation, then all waiting leaves are
+    evaluated with one predict_batch per network and the generators resumed.
+
+    Input:
+        tasks: list of step generators, started only when a place is free
+        batch_size: maximal number of generators running at once
+        callback: optional function called with (index, result) whenever a
+                  generator finishes, e.g. to report progress; its return
+                  value is ignored
+        stop: optional function called with (index, result) after callback.
+              If it returns true, all generators are stopped.
+
+    Returns:
+        results: the return values of the generators, in task order (None
+                 for the generators that were stopped)
+    """
+    results = [None] * len(tasks)
+    waiting = []  # (index, generator, (nnet, board)) of the generators waiting for an evaluation
+    upcoming = iter(enumerate(tasks))
+    stopped = False
+
+    def advance(i, steps, evaluation):
+        nonlocal stopped
+        try:
+            waiting.append((i, steps, steps.send(evaluation)))
+        except StopIteration as done:
+            results[i] = done.value
+            if callback is not None:
+                callback(i, done.value)
+            if stop is not None and stop(i, done.value):
+                stopped = True
+
+    def fill():
+        while len(waiting) < batch_size and not stopped:
+            task = next(upcoming, None)
+            if task is None:
+                return
+            advance(*task, None)
+
+    fill()
+    while waiting and not stopped:
+        current = list(waiting)
+        waiting.clear()
+        evaluations = [None] * len(current)
+        groups = {}  # positions in current of the requests of each network
+        for position, (_, _, (nnet, _)) in enumerate(current):
+            groups.setdefault(id(nnet), []).append(position)
+        for positions in groups.values():
+            nnet = current[positions[0]][2][0]
+            pis, vs = nnet.predict_batch(np.array([current[position][2][1] for position in positions]))
+            for row, position in enumerate(positions):
+                evaluations[position] = (pis[row], vs[row])
+        for (i, steps, _), evaluation in zip(current, evaluations):
+            advance(i, steps, evaluation)
+        fill()
+    return results
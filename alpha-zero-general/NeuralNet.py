@@ -1,4 +1,80 @@
-class NeuralNet():
+import functools
+import itertools
+import os
+import tempfile
+
+import numpy as np
+
+versions = itertools.count()
+
+
+def newModelVersion():
+    """
+    Returns a model version that is unique across processes.
+    """
+    return os.getpid(), next(versions)
+
+
+def getModelVersion(nnet):
+    """
+    Returns the version of nnet's current weights, which changes whenever
+    train, load_checkpoint or set_weights changes them (see NeuralNet.__init_subclass__).
+    """
+    if getattr(nnet, 'modelVersion', None) is None:
+        nnet.modelVersion = newModelVersion()
+    return nnet.modelVersion
+
+
+def changesWeights(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.modelVersion = newModelVersion()
+        return result
+
+    return wrapper
+
+
+class PredictionNet():
+    """
+    The prediction half of the NeuralNet interface. Proxies of a network that
+    is trained and checkpointed by its owner (see RemoteNNetWrapper and
+    SharedCacheNNet) implement only this, so MCTS and the players can use
+    them like a NeuralNet.
+    """
+
+    def predict(self, board):
+        """
+        Input:
+            board: current board in its canonical form.
+
+        Returns:
+            pi: a policy vector for the current board- a numpy array of length
+                game.getActionSize
+            v: a float in [-1,1] that gives the value of the current board
+        """
+        pass
+
+    def predict_batch(self, boards):
+        """
+        Input:
+            boards: a sequence (or stacked numpy array) of boards in their
+                    canonical form.
+
+        Returns:
+            pis: a numpy array of shape (len(boards), game.getActionSize)
+            vs: a numpy array of shape (len(boards),) with the values
+
+        The default implementation calls predict once per board. Wrappers that
+        can run a real batched forward pass should override it.
+        """
+        results = [self.predict(board) for board in boards]
+        pis = np.array([pi for pi, _ in results])
+        vs = np.array([v for _, v in results]).reshape(len(results))
+        return pis, vs
+
+
+class NeuralNet(PredictionNet):
     """
     This class specifies the base NeuralNet class. To define your own neural
     network, subclass this class and implement the functions below. The neural
@@ -8,6 +84,14 @@ class NeuralNet():
     See othello/NNet.py for an example implementation.
     """
 
+    def __init_subclass__(cls, **kwargs):
+        # a new model version for every change of the weights invalidates
+        # the network's entries in MCTS's evaluation cache
+        super().__init_subclass__(**kwargs)
+        for name in ('train', 'load_checkpoint', 'set_weights'):
+            if name in cls.__dict__:
+                setattr(cls, name, changesWeights(cls.__dict__[name]))
+
     def __init__(self, game):
         pass
 
@@ -24,18 +108,6 @@ class NeuralNet():
         """
         pass
 
-    def predict(self, board):
-        """
-        Input:
-            board: current board in its canonical form.
-
-        Returns:
-            pi: a policy vector for the current board- a numpy array of length
-                game.getActionSize
-            v: a float in [-1,1] that gives the value of the current board
-        """
-        pass
-
     def save_checkpoint(self, folder, filename):
         """
         Saves the current neural network (with its parameters) in
@@ -48,3 +120,32 @@ class NeuralNet():
         Loads parameters of the neural network from folder/filename
         """
         pass
+
+    def get_weights(self):
+        """
+        Returns:
+            weights: an in-memory copy of the parameters of the neural network
+                     that set_weights accepts, unaffected by further training
+
+        The default implementation reads back a checkpoint saved to a
+        temporary folder. Wrappers that can copy their parameters directly
+        should override it, together with set_weights.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            self.save_checkpoint(folder=folder, filename='snapshot.pth.tar')
+            weights = {}
+            for name in os.listdir(folder):
+                with open(os.path.join(folder, name), 'rb') as f:
+                    weights[name] = f.read()
+            return weights
+
+    def set_weights(self, weights):
+        """
+        Replaces the parameters of the neural network with weights from
+        get_weights.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            for name, data in weights.items():
+                with open(os.path.join(folder, name), 'wb') as f:
+                    f.write(data)
+            self.load_checkpoint(folder=folder, filename='snapshot.pth.tar')
@@ -0,0 +1,123 @@
+import logging
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from MCTS import MCTS, runBatched
+
+log = logging.getLogger(__name__)
+
+loaded = {}  # path -> (modification time, OpeningBook) of the books loaded by getBook
+
+
+def getBook(game, path):
+    """
+    Returns the OpeningBook in path, loaded once per process and again when
+    the file changes, or None if there is no book.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if path not in loaded or loaded[path][0] != mtime:
+        loaded[path] = (mtime, OpeningBook.load(game, path))
+    return loaded[path][1]
+
+
+class OpeningBook():
+    """
+    Root visit distributions of deep searches for the first plies of a game,
+    so the players do not search positions every game starts with again.
+
+    The book starts from every start position of the game (game.getStartBoards
+    if the game has it, else getInitBoard) and follows the width most visited
+    moves of every position for plies plies. Positions are kept in their
+    canonical form, keyed by stringRepresentation; the distributions are
+    sparse, (actions, probs) pairs. MCTS uses a book file given by
+    args.openingBook, see MCTS.getActionProbSteps.
+    """
+
+    def __init__(self, game, boards=(), policies=()):
+        self.game = game
+        self.entries = {}  # stringRepresentation -> (canonical board, actions, probs)
+        for board, (actions, probs) in zip(boards, policies):
+            self.entries[game.stringRepresentation(board)] = (board, actions, probs)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, canonicalBoard):
+        """
+        Returns:
+            counts: the root visit distribution of canonicalBoard as a dense
+                    array, or None if it is not in the book
+        """
+        entry = self.entries.get(self.game.stringRepresentation(canonicalBoard))
+        if entry is None:
+            return None
+        _, actions, probs = entry
+        counts = np.zeros(self.game.getActionSize())
+        counts[actions] = probs
+        return counts
+
+    @classmethod
+    def build(cls, game, nnet, args, plies, sims, width=3, batchSize=1):
+        """
+        Builds the book of nnet with searches of sims simulations (with
+        args.cpuct), batchSize of them at once, see MCTS.runBatched.
+        """
+        starts = game.getStartBoards() if hasattr(game, 'getStartBoards') else [game.getInitBoard()]
+        level = {}
+        for board in starts:
+            board = game.getCanonicalForm(board, 1)
+            level[game.stringRepresentation(board)] = board
+        book = cls(game)
+
+        for ply in range(plies):
+            boards = [board for board in level.values() if game.getGameEnded(board, 1) == 0]
+            tasks = []
+            for board in boards:
+                mcts = MCTS(game, nnet, args)
+                mcts.book = None  # the book being built must not answer its own searches
+                tasks.append(mcts.getActionProbSteps(board, temp=1, numSims=sims))
+            with tqdm(total=len(tasks), desc=f"Opening book ply {ply + 1}") as progress:
+                results = runBatched(tasks, batchSize, callback=lambda i, result: progress.update())
+
+            level = {}
+            for board, pi in zip(boards, results):
+                pi = np.asarray(pi, dtype=np.float32)
+                actions = np.flatnonzero(pi)
+                book.entries[game.stringRepresentation(board)] = (board, actions, pi[actions])
+                for action in actions[np.argsort(-pi[actions], kind='stable')][:width]:
+                    nextBoard, player = game.getNextState(board, 1, action)
+                    nextBoard = game.getCanonicalForm(nextBoard, player)
+                    s = game.stringRepresentation(nextBoard)
+                    if s not in book.entries:
+                        level[s] = nextBoard
+        return book
+
+    def save(self, path):
+        """
+        Writes the book to path (an .npz file), replacing it atomically.
+        """
+        entries = list(self.entries.values())
+        lengths = [len(actions) for _, actions, _ in entries]
+        columns = {
+            'boards': np.array([board for board, _, _ in entries]),
+            'offsets': np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            'actions': np.concatenate([actions for _, actions, _ in entries] or [[]]).astype(np.int32),
+            'probs': np.concatenate([probs for _, _, probs in entries] or [[]]).astype(np.float32),
+        }
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, game, path):
+        with np.load(path) as data:
+            offsets = data['offsets']
+            policies = [(data['actions'][start:end], data['probs'][start:end])
+                        for start, end in zip(offsets[:-1], offsets[1:])]
+            return cls(game, data['boards'], policies)
@@ -0,0 +1,58 @@
+import logging
+
+import numpy as np
+from tqdm import tqdm
+
+from MCTS import MCTS, runBatched
+
+log = logging.getLogger(__name__)
+
+
+class Reanalyser():
+    """
+    Refreshes the targets of stored examples with the current network
+    (reanalyse): every position gets a new search of args.reanalyseSims
+    simulations (default numMCTSSims) with a fresh tree. Its visit counts
+    become the new policy target, and with args.reanalyseValueWeight set, the
+    value target is mixed with the root value of the search:
+        v = (1 - reanalyseValueWeight) * v + reanalyseValueWeight * root value
+
+    The searches run args.reanalyseBatchSize (default selfPlayBatchSize or 1)
+    at a time with batched leaf evaluations, see MCTS.runBatched.
+    """
+
+    def __init__(self, game, nnet, args):
+        self.game = game
+        self.nnet = nnet
+        self.args = args
+        self.board_dtype = np.asarray(game.getInitBoard()).dtype  # the stored boards may be narrower
+
+    def searchSteps(self, board):
+        mcts = MCTS(self.game, self.nnet, self.args)
+        mcts.book = None  # the root value needs a search
+        pi = yield from mcts.getActionProbSteps(board, temp=1, numSims=self.args.get('reanalyseSims'))
+        return pi, mcts.rootValue(board)
+
+    def reanalyse(self, boards, values):
+        """
+        Input:
+            boards: the canonical boards of the examples
+            values: their current value targets
+
+        Returns:
+            policies: the new sparse policies, (actions, probs) pairs
+            values: the new value targets
+        """
+        tasks = [self.searchSteps(np.asarray(board, dtype=self.board_dtype)) for board in boards]
+        batch_size = self.args.get('reanalyseBatchSize') or self.args.get('selfPlayBatchSize') or 1
+        with tqdm(total=len(tasks), desc="Reanalyse") as progress:
+            results = runBatched(tasks, batch_size, callback=lambda i, result: progress.update())
+
+        policies = []
+        for pi, _ in results:
+            pi = np.asarray(pi, dtype=np.float32)
+            actions = np.flatnonzero(pi)
+            policies.append((actions, pi[actions]))
+        weight = self.args.get('reanalyseValueWeight') or 0
+        rootValues = np.array([value for _, value in results], dtype=np.float32)
+        return policies, (1 - weight) * np.asarray(values, dtype=np.float32) + weight * rootValues
@@ -0,0 +1,203 @@
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class ReplayBuffer():
+    """
+    Fixed-capacity replay memory for training examples, backed by numpy arrays
+    that are allocated once.
+
+    Positions are written in a ring: once capacity is reached, the oldest
+    positions are overwritten. Policies are stored as fixed-width sparse rows
+    of max_policy_entries (action, prob) pairs; MCTS policies have at most as
+    many non-zero entries as their search had simulations. A wider policy
+    (e.g. an aggregated one) widens the rows once, so no target is cut. Every
+    position records the iteration (age) it was added in, so old positions
+    can be evicted, a priority for prioritized sampling and a sample weight
+    (see CompactExamples.weights).
+
+    Like CompactExamples, the buffer supports len(), indexing (dense pi) and
+    batch(), so it can be passed to NNetWrapper.train directly. Index 0 is the
+    oldest position.
+    """
+
+    def __init__(self, capacity, board_shape, board_dtype, action_size, max_policy_entries, prob_dtype=np.float16):
+        self.capacity = capacity
+        self.action_size = action_size
+        action_dtype = np.uint16 if action_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+        self.boards = np.zeros((capacity,) + tuple(board_shape), dtype=board_dtype)
+        self.actions = np.zeros((capacity, max_policy_entries), dtype=action_dtype)
+        self.probs = np.zeros((capacity, max_policy_entries), dtype=prob_dtype)  # padding entries have prob 0
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.ages = np.zeros(capacity, dtype=np.int64)
+        self.priorities = np.zeros(capacity, dtype=np.float32)
+        self.weights = np.zeros(capacity, dtype=np.float32)
+
+        self.size = 0
+        self.next = 0  # slot the next position is written to
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        board, pis, vs = self.batch([i])
+        return board[0], pis[0], vs[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def slots(self, indices=None):
+        """
+        Maps indices (0 = oldest position) to buffer slots.
+        """
+        if indices is None:
+            indices = np.arange(self.size)
+        return (self.next - self.size + np.asarray(indices, dtype=np.int64)) % self.capacity
+
+    def add(self, examples, age):
+        """
+        Appends CompactExamples, overwriting the oldest positions when full.
+
+        Input:
+            examples: CompactExamples to add
+            age: iteration the examples were generated in
+        """
+        if not np.can_cast(examples.boards.dtype, self.boards.dtype):
+            raise ValueError(f'Cannot store {examples.boards.dtype} boards in a {self.boards.dtype} buffer')
+        if len(examples) > self.capacity:
+            examples = examples.tail(self.capacity)
+        n = len(examples)
+        slots = (self.next + np.arange(n)) % self.capacity
+
+        lengths = np.diff(examples.offsets)
+        if n:
+            self.widen(lengths.max())
+        rows = np.repeat(np.arange(n), lengths)
+        columns = np.arange(examples.offsets[-1]) - np.repeat(examples.offsets[:-1], lengths)
+        self.actions[slots] = 0
+        self.probs[slots] = 0
+        self.actions[slots[rows], columns] = examples.actions
+        self.probs[slots[rows], columns] = examples.probs
+
+        self.boards[slots] = examples.boards
+        self.values[slots] = examples.values
+        self.weights[slots] = examples.weights
+        self.ages[slots] = age
+        self.priorities[slots] = self.priorities[self.slots()].max() if self.size else 1.
+
+        self.next = (self.next + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def widen(self, width):
+        """
+        Grows the policy rows to hold width entries if they are narrower.
+        """
+        old = self.actions.shape[1]
+        if width <= old:
+            return
+        log.info(f'Widening the policy rows of the replay buffer from {old} to {width} entries')
+        padding = ((0, 0), (0, width - old))
+        self.actions = np.pad(self.actions, padding)
+        self.probs = np.pad(self.probs, padding)
+
+    def setTargets(self, indices, policies, values=None):
+        """
+        Overwrites the targets of the positions at indices (0 = oldest) with
+        sparse policies, (actions, probs) pairs, and values if given.
+        """
+        slots = self.slots(indices)
+        policies = list(policies)
+        if policies:
+            self.widen(max(len(actions) for actions, _ in policies))
+        for slot, (actions, probs) in zip(slots, policies):
+            self.actions[slot] = 0
+            self.probs[slot] = 0
+            self.actions[slot, :len(actions)] = actions
+            self.probs[slot, :len(actions)] = probs
+        if values is not None:
+            self.values[slots] = values
+
+    def evict(self, min_age):
+        """
+        Removes all positions added before iteration min_age.
+        """
+        # positions are added in age order, so the old ones are the oldest slots
+        old = np.count_nonzero(self.ages[self.slots()] < min_age)
+        self.size -= old
+
+    def batch(self, indices):
+        """
+        Builds dense arrays for the positions at indices (0 = oldest).
+
+        Returns:
+            boards, pis (float32, len(indices) x action_size), vs (float32)
+        """
+        return self.slotBatch(self.slots(indices))
+
+    def sampleWeights(self, indices):
+        return self.weights[self.slots(indices)]
+
+    def slotBatch(self, slots):
+        actions, probs = self.actions[slots], self.probs[slots]
+        rows, entries = np.nonzero(probs)  # skips the padding
+        pis = np.zeros((len(slots), self.action_size), dtype=np.float32)
+        pis[rows, actions[rows, entries]] = probs[rows, entries]
+        return self.boards[slots], pis, self.values[slots]
+
+    def sample(self, n, prioritized=False, alpha=1.):
+        """
+        Draws n positions with replacement, uniformly or proportional to
+        priority ** alpha.
+
+        Returns:
+            sample: a ReplaySample view that can be passed to NNetWrapper.train
+        """
+        if prioritized:
+            slots = self.slots()
+            p = self.priorities[slots].astype(np.float64) ** alpha
+            slots = np.random.choice(slots, size=n, p=p / p.sum())
+        else:
+            slots = self.slots(np.random.randint(self.size, size=n))
+        return ReplaySample(self, slots)
+
+    def updatePriorities(self, slots, priorities):
+        self.priorities[slots] = priorities
+
+    def updateValueErrors(self, slots, vs, epsilon=0.01):
+        """
+        Sets the priorities of slots to the value errors |z - v| of the
+        network's predictions vs, plus epsilon so no position is left out.
+        """
+        self.updatePriorities(slots, np.abs(self.values[slots] - np.asarray(vs, dtype=np.float32)) + epsilon)
+
+
+class ReplaySample():
+    """
+    A sampled set of ReplayBuffer slots, usable as training examples.
+    """
+
+    def __init__(self, buffer, slots):
+        self.buffer = buffer
+        self.slots = slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __getitem__(self, i):
+        board, pis, vs = self.batch([i])
+        return board[0], pis[0], vs[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def batch(self, indices):
+        return self.buffer.slotBatch(self.slots[np.asarray(indices, dtype=np.int64)])
+
+    def sampleWeights(self, indices):
+        return self.buffer.weights[self.slots[np.asarray(indices, dtype=np.int64)]]
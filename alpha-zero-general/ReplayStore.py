@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+from CompactExamples import CompactExamples
+
+log = logging.getLogger(__name__)
+
+COLUMNS = ('boards', 'offsets', 'actions', 'probs', 'values', 'weights')
+
+
+class ReplayStore():
+    """
+    Append-only, segmented on-disk store for self-play examples.
+
+    Every iteration's CompactExamples are written once as a segment: a folder
+    with one .npy file per column. A small manifest lists the segments in the
+    current training window, oldest first. Rolling over an iteration only
+    writes the new segment and the manifest. Loading memory-maps the segments
+    instead of unpickling the whole history.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.segments = []  # names of the segments in the window, oldest first
+        self.action_size = None
+        self.nextSegment = 0  # number of the next segment, segment names are never reused
+
+        manifest = os.path.join(folder, 'manifest.json')
+        if os.path.isfile(manifest):
+            with open(manifest) as f:
+                data = json.load(f)
+            self.segments = data['segments']
+            self.action_size = data['action_size']
+            self.nextSegment = data['next_segment']
+
+    def exists(self):
+        return len(self.segments) > 0
+
+    def append(self, examples):
+        """
+        Writes examples as a new segment and appends it to the window.
+        """
+        self.segments.append(self.writeSegment(examples))
+        self.writeManifest()
+
+    def replace(self, position, examples):
+        """
+        Replaces the segment at position in the window (0 = oldest) with
+        examples, e.g. with refreshed targets. The new segment is written
+        under a new name before the manifest switches to it, so a crash leaves
+        either the old or the new one in the window.
+
+        Returns:
+            examples: the new segment, memory-mapped
+        """
+        old = self.segments[position]
+        self.segments[position] = self.writeSegment(examples)
+        self.writeManifest()
+        shutil.rmtree(os.path.join(self.folder, old), ignore_errors=True)
+        return self.loadSegment(self.segments[position])
+
+    def writeSegment(self, examples):
+        """
+        Writes examples as a new segment.
+
+        Returns:
+            name: the name of the segment
+        """
+        name = f'segment_{self.nextSegment:06d}'
+        path = os.path.join(self.folder, name)
+        tmp = path + '.tmp'
+        for p in (path, tmp):
+            if os.path.exists(p):
+                # left over by a run that stopped before updating the manifest
+                shutil.rmtree(p)
+        os.makedirs(tmp)
+        for column in COLUMNS:
+            np.save(os.path.join(tmp, column + '.npy'), getattr(examples, column))
+        os.replace(tmp, path)
+
+        self.action_size = examples.action_size
+        self.nextSegment += 1
+        return name
+
+    def keepLatest(self, n):
+        """
+        Shrinks the window to the n most recent segments and deletes the
+        segments that dropped out of it.
+        """
+        if len(self.segments) <= n:
+            return
+        dropped, self.segments = self.segments[:len(self.segments) - n], self.segments[len(self.segments) - n:]
+        self.writeManifest()
+        for name in dropped:
+            shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+
+    def load(self):
+        """
+        Returns:
+            history: list of memory-mapped CompactExamples, one per segment in
+                     the window, oldest first
+        """
+        return [self.loadSegment(name) for name in self.segments]
+
+    def loadSegment(self, name):
+        path = os.path.join(self.folder, name)
+        columns = {column: np.load(os.path.join(path, column + '.npy'), mmap_mode='r')
+                   for column in COLUMNS if os.path.isfile(os.path.join(path, column + '.npy'))}
+        # segments written before examples were weighted have no weights column
+        return CompactExamples(action_size=self.action_size, **columns)
+
+    def writeManifest(self):
+        os.makedirs(self.folder, exist_ok=True)
+        manifest = os.path.join(self.folder, 'manifest.json')
+        with open(manifest + '.tmp', 'w') as f:
+            json.dump({'segments': self.segments, 'action_size': self.action_size,
+                       'next_segment': self.nextSegment}, f)
+        os.replace(manifest + '.tmp', manifest)
@@ -0,0 +1,142 @@
+import logging
+from collections import deque
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class ResignGame():
+    """
+    Resignation state of one self-play game (see Resignation.newGame). It is
+    sent to the process playing the game and back, so it stays small: the
+    root values of the game and its result.
+    """
+
+    def __init__(self, threshold, moves, playtest):
+        self.threshold = threshold  # None in playtest games, which never resign
+        self.moves = moves
+        self.playtest = playtest
+        self.players = []  # player to move at every move
+        self.values = []  # root value at every move, for the player to move
+        self.streaks = {1: 0, -1: 0}
+        self.resigned = 0  # player who resigned, or 0
+        self.winner = 0  # 1, -1, or 0 for a draw
+
+    def observe(self, player, value):
+        """
+        Records the root value of the player to move after the search.
+
+        Returns:
+            resign: whether the player resigns, its value having been below
+                    the threshold in its last self.moves moves
+        """
+        self.players.append(player)
+        self.values.append(float(value))
+        if self.threshold is None:
+            return False
+        self.streaks[player] = self.streaks[player] + 1 if value < self.threshold else 0
+        if self.streaks[player] >= self.moves:
+            self.resigned = player
+            self.winner = -player
+            return True
+        return False
+
+    def finish(self, winner):
+        self.winner = winner
+
+    def firstResignation(self, threshold):
+        """
+        Returns the player who would have resigned first with threshold, or 0.
+        """
+        streaks = {1: 0, -1: 0}
+        for player, value in zip(self.players, self.values):
+            streaks[player] = streaks[player] + 1 if value < threshold else 0
+            if streaks[player] >= self.moves:
+                return player
+        return 0
+
+
+class Resignation():
+    """
+    Value-based resignation for self-play: a player resigns when the root
+    value of its search has been below the threshold for moves consecutive
+    moves of its own.
+
+    A fraction playtestFraction of the games never resign but records where
+    they would have. The threshold is recalibrated from the latest history
+    playtest games (once there are minGames of them) to the highest one at
+    which at most falsePositiveRate of the games that would have been resigned
+    were not lost by the resigning player. Only thresholds at which at least
+    minResignations playtest games would have been resigned are considered;
+    without such evidence the threshold stays as it is.
+    """
+
+    def __init__(self, threshold=-0.9, moves=3, playtestFraction=0.1, falsePositiveRate=0.05, history=500,
+                 minGames=20, minResignations=10):
+        self.threshold = threshold
+        self.moves = moves
+        self.playtestFraction = playtestFraction
+        self.falsePositiveRate = falsePositiveRate
+        self.minGames = minGames
+        self.minResignations = minResignations
+        self.playtests = deque(maxlen=history)
+
+    def newGame(self):
+        """
+        Returns the ResignGame for a new game, a playtest with probability
+        playtestFraction.
+        """
+        playtest = np.random.random() < self.playtestFraction
+        return ResignGame(None if playtest else self.threshold, self.moves, playtest)
+
+    def falsePositives(self, threshold):
+        """
+        Returns (resigned, wrong): the number of playtest games that would
+        have been resigned with threshold and how many of those the resigning
+        player did not lose.
+        """
+        resigned = wrong = 0
+        for game in self.playtests:
+            player = game.firstResignation(threshold)
+            if player != 0:
+                resigned += 1
+                wrong += game.winner != -player
+        return resigned, wrong
+
+    def update(self, games):
+        """
+        Adds the finished ResignGames of an iteration, logs how many games
+        were resigned and recalibrates the threshold.
+        """
+        games = [game for game in games if game is not None]
+        if not games:
+            return
+        resigned = sum(game.resigned != 0 for game in games)
+        lengths = [len(game.values) for game in games]
+        self.playtests.extend(game for game in games if game.playtest)
+        log.info(f'Resigned {resigned} of {len(games)} games (mean length {np.mean(lengths):.1f} moves), '
+                 f'threshold {self.threshold:.2f}')
+        if len(self.playtests) < self.minGames:
+            return
+
+        # raise the threshold as long as the false positive rate stays low enough, judging only thresholds
+        # with enough would-be resignations (higher thresholds resign at least as many games)
+        threshold = -1.
+        judged = False
+        for candidate in np.arange(-0.95, 0.01, 0.05):
+            resigned, wrong = self.falsePositives(candidate)
+            if resigned < self.minResignations:
+                continue
+            judged = True
+            if wrong > self.falsePositiveRate * resigned:
+                break
+            threshold = round(float(candidate), 2)
+        if not judged:
+            log.info(f'Too few would-be resignations in {len(self.playtests)} playtest games, '
+                     f'keeping the resign threshold {self.threshold:.2f}')
+            return
+        resigned, wrong = self.falsePositives(threshold)
+        log.info(f'Resign threshold {self.threshold:.2f} -> {threshold:.2f}: {wrong} of {resigned} '
+                 f'resignations in {len(self.playtests)} playtest games would have been wrong')
+        self.threshold = threshold
@@ -0,0 +1,55 @@
+import math
+
+
+class SPRT():
+    """
+    Sequential test deciding whether a new network wins at least a threshold
+    fraction of the decisive games of a gating match, usable as the stopper of
+    Arena.playGames.
+
+    It stops a match of num games as soon as
+        - the decision can no longer change, whatever the remaining games'
+          results (curtailment), or
+        - Wald's sequential probability ratio test between the win rates
+          threshold - delta (reject) and threshold + delta (accept) crosses one
+          of its bounds. alpha is the probability of accepting a network whose
+          win rate is threshold - delta, beta the probability of rejecting one
+          whose win rate is threshold + delta.
+    Draws carry no information for the test, like in Coach's decision.
+    """
+
+    def __init__(self, threshold, num, alpha=0.05, beta=0.05, delta=0.1):
+        self.threshold = threshold
+        self.num = num
+        self.p0 = max(threshold - delta, 1e-3)
+        self.p1 = min(threshold + delta, 1 - 1e-3)
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+
+    def llr(self, wins, losses):
+        """
+        Returns the log likelihood ratio of accepting over rejecting.
+        """
+        return wins * math.log(self.p1 / self.p0) + losses * math.log((1 - self.p1) / (1 - self.p0))
+
+    def __call__(self, wins, losses, draws):
+        """
+        Input:
+            wins, losses, draws: results of the new network so far
+
+        Returns:
+            reason: why the match can stop, or None to continue
+        """
+        remaining = self.num - wins - losses - draws
+        if remaining <= 0:
+            return None  # the match is over anyway
+        if wins + losses > 0 and wins / (wins + losses + remaining) >= self.threshold:
+            return f'accepted even if the remaining {remaining} games are lost'
+        if wins + remaining == 0 or (wins + remaining) / (wins + losses + remaining) < self.threshold:
+            return f'rejected even if the remaining {remaining} games are won'
+        llr = self.llr(wins, losses)
+        if llr >= self.upper:
+            return f'SPRT accepted (llr {llr:.2f} >= {self.upper:.2f})'
+        if llr <= self.lower:
+            return f'SPRT rejected (llr {llr:.2f} <= {self.lower:.2f})'
+        return None
@@ -0,0 +1,191 @@
+import hashlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from GameCache import checkpointHash
+from NeuralNet import PredictionNet
+from utils import processContext
+
+NUM_LOCKS = 64  # writers lock one of these stripes of slots, readers never lock
+
+
+def boardHash(board):
+    """
+    Returns a 64-bit hash of board that is the same in every process (unlike
+    hash(), which is salted per process under the spawn start method).
+    """
+    digest = hashlib.blake2b(np.ascontiguousarray(board).tobytes(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def checkpointVersion(folder, filename):
+    """
+    Returns the version of the network in checkpoint folder/filename for a
+    SharedEvalTable: the same for the same weights in every process, never 0.
+    """
+    return int(checkpointHash(folder, filename), 16) or 1
+
+
+class SharedEvalTable():
+    """
+    Fixed-size hash table of network evaluations in shared memory, for the
+    worker processes of a self-play or arena pool, so a position evaluated by
+    one worker is not evaluated again by the others.
+
+    Every slot holds one entry: the 64-bit hash of a board, the version of the
+    network that evaluated it, its value and its policy (action_size float32).
+    A board goes to slot hash % slots and replaces whatever was there, so the
+    table never grows; it takes slots * (28 + 4 * action_size) bytes.
+
+    Slots are guarded by a sequence number (a seqlock): a writer makes it odd
+    while it writes the entry and even again when done, and a reader that sees
+    an odd or changed sequence number treats the entry as missing. Writers
+    take the lock of the slot's stripe without blocking and skip the write if
+    another process holds it. A version of 0 marks an empty slot.
+
+    The creating process owns the shared memory block and must unlink it
+    (close, or leave the with block) once all workers are done. A table is
+    passed to workers when they are started, e.g. in a Pool's initargs; they
+    attach to the same block.
+    """
+
+    def __init__(self, action_size, slots, context=None):
+        context = context or processContext()
+        self.action_size = action_size
+        self.slots = slots
+        self.locks = [context.Lock() for _ in range(NUM_LOCKS)]
+        self.memory = shared_memory.SharedMemory(create=True, size=slots * self.entryType().itemsize)
+        self.owner = True
+        self.attach()
+
+    def entryType(self):
+        return np.dtype([('seq', np.uint64), ('key', np.uint64), ('version', np.uint64), ('value', np.float32),
+                         ('policy', np.float32, (self.action_size,))])
+
+    def attach(self):
+        entries = np.ndarray(self.slots, dtype=self.entryType(), buffer=self.memory.buf)
+        self.seqs = entries['seq']
+        self.keys = entries['key']
+        self.versions = entries['version']
+        self.values = entries['value']
+        self.policies = entries['policy']
+
+    def __getstate__(self):
+        return {'action_size': self.action_size, 'slots': self.slots, 'locks': self.locks,
+                'name': self.memory.name}
+
+    def __setstate__(self, state):
+        self.action_size = state['action_size']
+        self.slots = state['slots']
+        self.locks = state['locks']
+        self.memory = shared_memory.SharedMemory(name=state['name'])
+        self.owner = False
+        self.attach()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Detaches from the shared memory block, which the owner also unlinks.
+        """
+        if self.memory is None:
+            return
+        self.seqs = self.keys = self.versions = self.values = self.policies = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+        self.memory = None
+
+    def get(self, key, version):
+        """
+        Returns:
+            pi, v: the evaluation of the board with hash key by the network
+                   version, or None if the table does not hold it
+        """
+        i = key % self.slots
+        seq = int(self.seqs[i])
+        if seq & 1 or int(self.keys[i]) != key or int(self.versions[i]) != version:
+            return None
+        pi, v = self.policies[i].copy(), self.values[i]
+        if int(self.seqs[i]) != seq:
+            return None  # overwritten while reading
+        return pi, v
+
+    def put(self, key, version, pi, v):
+        """
+        Stores the evaluation pi, v of the board with hash key by the network
+        version, unless another process is writing to the slot's stripe.
+        """
+        i = key % self.slots
+        lock = self.locks[i % NUM_LOCKS]
+        if not lock.acquire(block=False):
+            return
+        try:
+            self.seqs[i] += 1
+            self.keys[i] = key
+            self.versions[i] = version
+            self.values[i] = np.asarray(v).reshape(-1)[0]
+            self.policies[i] = pi
+            self.seqs[i] += 1
+        finally:
+            lock.release()
+
+    def usage(self, version):
+        """
+        Returns the number of entries of the network version.
+        """
+        return int(np.count_nonzero(self.versions == version))
+
+
+class SharedCacheNNet(PredictionNet):
+    """
+    Looks up the evaluations of nnet in a SharedEvalTable before predicting,
+    and stores the evaluations it makes. It only predicts; nnet is trained
+    and loaded by its owner, who wraps it again with the version of the new
+    weights. The version identifies nnet's weights in all processes, see
+    checkpointVersion.
+    """
+
+    def __init__(self, nnet, table, version):
+        self.nnet = nnet
+        self.table = table
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+    def predict(self, board):
+        key = boardHash(board)
+        cached = self.table.get(key, self.version)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        pi, v = self.nnet.predict(board)
+        self.table.put(key, self.version, pi, v)
+        return pi, v
+
+    def predict_batch(self, boards):
+        boards = np.asarray(boards)
+        keys = [boardHash(board) for board in boards]
+        pis = np.zeros((len(boards), self.table.action_size), dtype=np.float32)
+        vs = np.zeros(len(boards), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.table.get(key, self.version)
+            if cached is None:
+                missing.append(i)
+            else:
+                pis[i], vs[i] = cached
+        self.hits += len(boards) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            newPis, newVs = self.nnet.predict_batch(boards[missing])
+            for i, pi, v in zip(missing, newPis, np.asarray(newVs).reshape(-1)):
+                self.table.put(keys[i], self.version, pi, v)
+                pis[i], vs[i] = pi, v
+        return pis, vs
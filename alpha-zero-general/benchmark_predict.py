@@ -0,0 +1,59 @@
+"""
+Measures the inference throughput (positions/sec) of an untrained network
+through NNetWrapper.predict_batch for a range of batch sizes.
+
+Example:
+    python benchmark_predict.py --game othello --threads 4 --jit
+"""
+import argparse
+import time
+
+import numpy as np
+
+
+def load_game_and_nnet(name):
+    if name == 'othello':
+        from othello.OthelloGame import OthelloGame
+        from othello.pytorch import NNet
+        return OthelloGame(8), NNet
+    if name == 'tafl':
+        from tafl.TaflGame import TaflGame
+        from tafl.pytorch import NNet
+        return TaflGame("Brandubh"), NNet
+    raise ValueError(f'Unknown game {name}')
+
+
+def benchmark(nnet, board, batch_size, seconds):
+    boards = np.repeat(board[np.newaxis], batch_size, axis=0)
+    nnet.predict_batch(boards)  # warm up (buffer allocation, tracing)
+
+    positions = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        nnet.predict_batch(boards)
+        positions += batch_size
+    return positions / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark batched NNetWrapper inference.')
+    parser.add_argument('--game', choices=['othello', 'tafl'], default='othello')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64, 128, 256])
+    parser.add_argument('--threads', type=int, default=None, help='intra-op threads used by torch')
+    parser.add_argument('--jit', action='store_true', help='use the TorchScript-traced module')
+    parser.add_argument('--seconds', type=float, default=2.0, help='measuring time per batch size')
+    options = parser.parse_args()
+
+    game, NNet = load_game_and_nnet(options.game)
+    NNet.args.num_threads = options.threads
+    NNet.args.jit = options.jit
+    nnet = NNet.NNetWrapper(game)
+    board = game.getCanonicalForm(game.getInitBoard(), 1)
+
+    print(f'{"batch size":>10} {"positions/sec":>14}')
+    for batch_size in options.batch_sizes:
+        print(f'{batch_size:>10} {benchmark(nnet, board, batch_size, options.seconds):>14.1f}')
+
+
+if __name__ == "__main__":
+    main()
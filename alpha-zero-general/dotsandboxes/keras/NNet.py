@@ -4,6 +4,7 @@ import os
 sys.path.append('..')
 from utils import dotdict
 from NeuralNet import NeuralNet
+from ExampleStream import ExampleStream
 
 from .DotsAndBoxesNNet import DotsAndBoxesNNet as onnet
 
@@ -32,6 +33,7 @@ def normalize_score(board):
 
     board[:, 0, -1] = normalized_score
     board[:, 1, -1] = 0
+    return board
 
 
 class NNetWrapper(NeuralNet):
@@ -44,14 +46,9 @@ class NNetWrapper(NeuralNet):
         """
         examples: list of examples, each example is of form (board, pi, v)
         """
-        input_boards, target_pis, target_vs = list(zip(*examples))
-        input_boards = np.asarray(input_boards)
-
-        normalize_score(input_boards)
-
-        target_pis = np.asarray(target_pis)
-        target_vs = np.asarray(target_vs)
-        self.nnet.model.fit(x=input_boards, y=[target_pis, target_vs], batch_size=args.batch_size, epochs=args.epochs)
+        stream = ExampleStream(examples, action_size=self.action_size, batch_size=args.batch_size,
+                               transform=normalize_score)
+        self.nnet.model.fit(stream.dataset(), steps_per_epoch=len(stream), epochs=args.epochs, shuffle=False)
 
     def predict(self, board):
         """
@@ -66,6 +63,22 @@ class NNetWrapper(NeuralNet):
 
         return pi[0], v[0]
 
+    def predict_batch(self, boards):
+        """
+        boards: np array (or list of np arrays) with boards, evaluated in one forward pass
+        """
+        boards = np.array(boards)
+        normalize_score(boards)
+        pis, vs = self.nnet.model.predict(boards, batch_size=len(boards), verbose=False)
+
+        return pis, vs.reshape(len(boards))
+
+    def get_weights(self):
+        return self.nnet.model.get_weights()
+
+    def set_weights(self, weights):
+        self.nnet.model.set_weights(weights)
+
     def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
         # change extension
         filename = filename.split(".")[0] + ".h5"
@@ -10,6 +10,7 @@ import tensorflow as tf
 sys.path.append('..')
 from utils import *
 from NeuralNet import NeuralNet
+from ExampleStream import ExampleStream
 
 import argparse
 from .GobangNNet import GobangNNet as onnet
@@ -35,11 +36,8 @@ class NNetWrapper(NeuralNet):
         """
         examples: list of examples, each example is of form (board, pi, v)
         """
-        input_boards, target_pis, target_vs = list(zip(*examples))
-        input_boards = np.asarray(input_boards)
-        target_pis = np.asarray(target_pis)
-        target_vs = np.asarray(target_vs)
-        self.nnet.model.fit(x = input_boards, y = [target_pis, target_vs], batch_size = args.batch_size, epochs = args.epochs)
+        stream = ExampleStream(examples, action_size=self.action_size, batch_size=args.batch_size)
+        self.nnet.model.fit(stream.dataset(), steps_per_epoch=len(stream), epochs=args.epochs, shuffle=False)
 
     def predict(self, board):
         """
@@ -56,6 +54,21 @@ class NNetWrapper(NeuralNet):
         #print('PREDICTION TIME TAKEN : {0:03f}'.format(time.time()-start))
         return pi[0], v[0]
 
+    def predict_batch(self, boards):
+        """
+        boards: np array (or list of np arrays) with boards, evaluated in one forward pass
+        """
+        boards = np.asarray(boards)
+        pis, vs = self.nnet.model.predict(boards, batch_size=len(boards), verbose=False)
+
+        return pis, vs.reshape(len(boards))
+
+    def get_weights(self):
+        return self.nnet.model.get_weights()
+
+    def set_weights(self, weights):
+        self.nnet.model.set_weights(weights)
+
     def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
         # change extension
         filename = filename.split(".")[0] + ".h5"
@@ -39,13 +39,21 @@ class LKIDGame(Game):
         board = self._create_initial_board()
         return self._board_to_state(board)
 
-    def _create_initial_board(self):
-        """Create and return the initial board configuration with random start positions."""
+    def getStartBoards(self):
+        """Return the states of all start positions, one of which getInitBoard picks at random."""
+        return [self._board_to_state(self._create_initial_board(start)) for start in self._start_positions()]
+
+    def _create_initial_board(self, start=None):
+        """Create and return the initial board configuration of start, by default a random start position."""
         import random
         board = Board(n=self.n, barriers=self.barriers)
+        p1_state, p2_state, priest_pos = start if start is not None else random.choice(self._start_positions())
+        board.setup_board(p1_state, p2_state, priest_pos)
+        return board
 
-        # List of (p1_state, p2_state, priest_pos) tuples
-        start_positions = [
+    def _start_positions(self):
+        """Return the list of (p1_state, p2_state, priest_pos) tuples of the start positions."""
+        return [
             # --- Standard ---
             ([ (0, 0, Board.CHURCH_TOWER, Board.HORIZONTAL),
                 (4, 4, Board.CHURCH_SHIP, Board.HORIZONTAL),
@@ -137,11 +145,6 @@ class LKIDGame(Game):
              (2, 2)),
         ]
 
-        # Randomly select one starting position
-        p1_state, p2_state, priest_pos = random.choice(start_positions)
-        board.setup_board(p1_state, p2_state, priest_pos)
-        return board
-
     def _board_to_state(self, board):
         """Convert Board object to numpy array state."""
         state = np.zeros(self.board_size, dtype=np.int32)
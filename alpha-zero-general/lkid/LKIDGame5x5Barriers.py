@@ -5,7 +5,6 @@ adds four permanent barrier cells (0,2), (2,0), (2,4), and (4,2). Barriers have
 no owner, cannot be moved, and block pieces movement.
 """
 from __future__ import print_function
-import random
 import sys
 
 sys.path.append('..')
@@ -23,10 +22,9 @@ class LKIDGame5x5Barriers(BaseLKID5x5):
         super().__init__()
         self.barriers = self.DEFAULT_BARRIERS
 
-    def _create_initial_board(self):
-        board = Board(n=self.n, barriers=self.barriers)
-
-        start_positions = [
+    def _start_positions(self):
+        """Return the list of (p1_state, p2_state, priest_pos) tuples of the start positions."""
+        return [
             ([ (0, 0, Board.CHURCH_TOWER, Board.HORIZONTAL),
                 (4, 4, Board.CHURCH_SHIP, Board.HORIZONTAL),
                 (1, 1, Board.HOUSE, Board.HORIZONTAL),
@@ -83,7 +81,3 @@ class LKIDGame5x5Barriers(BaseLKID5x5):
             ],
              (2, 2)),
         ]
-
-        p1_state, p2_state, priest_pos = random.choice(start_positions)
-        board.setup_board(p1_state, p2_state, priest_pos)
-        return board
\ No newline at end of file
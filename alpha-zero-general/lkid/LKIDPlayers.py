@@ -5,6 +5,7 @@ Includes random, human, and greedy players.
 import sys
 sys.path.append('..')
 from lkid.LKIDGame import LKIDGame
+from lkid.LKIDLogic import Board
 import numpy as np
 
 
@@ -18,6 +19,44 @@ class RandomPlayer:
         move = np.random.choice(np.where(valids)[0])
         return move
 
+class GreedyLKIDPlayer:
+    def __init__(self, game):
+        self.game = game
+
+    def score(self, board):
+        """
+        Heuristic value of a position for player 1: the number of own buildings
+        connected to the church tower, plus a bonus if tower and ship are
+        adjacent.
+        """
+        board = self.game._state_to_board(board)
+        tower, ship = None, None
+        for x in range(board.n):
+            for y in range(board.n):
+                owner, piece_type, _ = board._get_piece(x, y)
+                if owner == 1 and piece_type == Board.CHURCH_TOWER:
+                    tower = (x, y)
+                elif owner == 1 and piece_type == Board.CHURCH_SHIP:
+                    ship = (x, y)
+        if tower is None:
+            return 0
+        connected = sum(1 for x in range(board.n) for y in range(board.n)
+                        if board._get_piece(x, y)[0] == 1 and board.is_connected_to_church(x, y, 1))
+        return connected + (2 if ship is not None and board.is_adjacent(*tower, *ship) else 0)
+
+    def play(self, board):
+        """Return a winning move if there is one, else the move with the best score."""
+        valids = self.game.getValidMoves(board, 1)
+        candidates = []
+        for a in np.flatnonzero(valids):
+            nextBoard, _ = self.game.getNextState(board, 1, a)
+            ended = self.game.getGameEnded(nextBoard, 1)
+            if ended == 1:
+                return a
+            # moves that let the opponent win are the last resort
+            candidates.append((ended == 0, self.score(nextBoard), np.random.random(), a))
+        return max(candidates)[3]
+
 class HumanLKIDPlayer:
     def __init__(self, game):
         self.game = game
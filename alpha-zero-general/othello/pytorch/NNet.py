@@ -1,6 +1,7 @@
 import os
 import sys
-import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 from tqdm import tqdm
@@ -21,6 +22,9 @@ args = dotdict({
     'batch_size': 64,
     'cuda': torch.cuda.is_available(),
     'num_channels': 512,
+    'num_threads': None,  # intra-op threads used by torch, None keeps torch's default
+    'jit': False,  # run inference through a TorchScript-traced copy of the network
+    'prefetch': 0,  # number of training batches prepared ahead on a background thread, 0 disables it
 })
 
 
@@ -32,12 +36,34 @@ class NNetWrapper(NeuralNet):
 
         if args.cuda:
             self.nnet.cuda()
+        if args.num_threads:
+            torch.set_num_threads(args.num_threads)
+
+        self.input_buffer = None  # reused (pinned when using cuda) host buffer for predict_batch
+        self.traced = None  # lazily traced TorchScript module, see predict_batch
 
     def train(self, examples):
         """
         examples: list of examples, each example is of form (board, pi, v)
         """
         optimizer = optim.Adam(self.nnet.parameters())
+        self.traced = None
+
+        # convert the examples once into contiguous float32 tensors, minibatches are index slices of those
+        if hasattr(examples, 'batch'):
+            boards, pis, vs = examples.batch(np.arange(len(examples)))
+        else:
+            boards, pis, vs = list(zip(*examples))
+        if hasattr(examples, 'sampleWeights'):
+            # aggregated examples stand for several positions, scale the weights to a mean of 1
+            weights = examples.sampleWeights(np.arange(len(examples))).astype(np.float32)
+            weights *= len(weights) / weights.sum()
+        else:
+            weights = np.ones(len(vs), dtype=np.float32)
+        dataset = (torch.from_numpy(np.array(boards, dtype=np.float32)),
+                   torch.from_numpy(np.array(pis, dtype=np.float32)),
+                   torch.from_numpy(np.array(vs, dtype=np.float32)),
+                   torch.from_numpy(weights))
 
         for epoch in range(args.epochs):
             print('EPOCH ::: ' + str(epoch + 1))
@@ -47,22 +73,12 @@ class NNetWrapper(NeuralNet):
 
             batch_count = int(len(examples) / args.batch_size)
 
-            t = tqdm(range(batch_count), desc='Training Net')
-            for _ in t:
-                sample_ids = np.random.randint(len(examples), size=args.batch_size)
-                boards, pis, vs = list(zip(*[examples[i] for i in sample_ids]))
-                boards = torch.FloatTensor(np.array(boards).astype(np.float64))
-                target_pis = torch.FloatTensor(np.array(pis))
-                target_vs = torch.FloatTensor(np.array(vs).astype(np.float64))
-
-                # predict
-                if args.cuda:
-                    boards, target_pis, target_vs = boards.contiguous().cuda(), target_pis.contiguous().cuda(), target_vs.contiguous().cuda()
-
+            t = tqdm(self.get_batches(dataset, batch_count), total=batch_count, desc='Training Net')
+            for boards, target_pis, target_vs, weights in t:
                 # compute output
                 out_pi, out_v = self.nnet(boards)
-                l_pi = self.loss_pi(target_pis, out_pi)
-                l_v = self.loss_v(target_vs, out_v)
+                l_pi = self.loss_pi(target_pis, out_pi, weights)
+                l_v = self.loss_v(target_vs, out_v, weights)
                 total_loss = l_pi + l_v
 
                 # record loss
@@ -75,29 +91,90 @@ class NNetWrapper(NeuralNet):
                 total_loss.backward()
                 optimizer.step()
 
+    def get_batches(self, dataset, batch_count):
+        """
+        Yields batch_count minibatches of one shuffled epoch over the dataset tensors. With args.prefetch > 0
+        that many upcoming batches are gathered (and copied to the gpu) on a background thread while the
+        current one is trained on.
+        """
+        permutation = torch.randperm(dataset[0].size(0))
+
+        def make_batch(i):
+            ids = permutation[i * args.batch_size:(i + 1) * args.batch_size]
+            batch = [tensor[ids] for tensor in dataset]
+            if args.cuda:
+                batch = [tensor.pin_memory().cuda(non_blocking=True) for tensor in batch]
+            return batch
+
+        if not args.prefetch:
+            for i in range(batch_count):
+                yield make_batch(i)
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = deque(executor.submit(make_batch, i) for i in range(min(args.prefetch, batch_count)))
+            for i in range(args.prefetch, batch_count + args.prefetch):
+                batch = pending.popleft().result()
+                if i < batch_count:
+                    pending.append(executor.submit(make_batch, i))
+                yield batch
+
     def predict(self, board):
         """
         board: np array with board
         """
-        # timing
-        start = time.time()
-
-        # preparing input
-        board = torch.FloatTensor(board.astype(np.float64))
-        if args.cuda: board = board.contiguous().cuda()
-        board = board.view(1, self.board_x, self.board_y)
-        self.nnet.eval()
-        with torch.no_grad():
-            pi, v = self.nnet(board)
-
-        # print('PREDICTION TIME TAKEN : {0:03f}'.format(time.time()-start))
-        return torch.exp(pi).data.cpu().numpy()[0], v.data.cpu().numpy()[0]
+        pis, vs = self.predict_batch(board[np.newaxis])
+        return pis[0], vs[0]
 
-    def loss_pi(self, targets, outputs):
-        return -torch.sum(targets * outputs) / targets.size()[0]
+    def predict_batch(self, boards):
+        """
+        boards: np array (or list of np arrays) with boards, shape batch_size x board_x x board_y
 
-    def loss_v(self, targets, outputs):
-        return torch.sum((targets - outputs.view(-1)) ** 2) / targets.size()[0]
+        Returns the policies (batch_size x action_size) and values (batch_size).
+        """
+        boards = np.asarray(boards)
+        batch_size = boards.shape[0]
+
+        # copy the boards into a reusable float32 buffer instead of allocating new tensors on every call
+        if self.input_buffer is None or self.input_buffer.size(0) < batch_size:
+            capacity = 1 << max(batch_size - 1, 0).bit_length()
+            self.input_buffer = torch.empty((capacity, self.board_x, self.board_y), dtype=torch.float32,
+                                            pin_memory=args.cuda)
+        inputs = self.input_buffer[:batch_size]
+        inputs.copy_(torch.from_numpy(boards.reshape(batch_size, self.board_x, self.board_y)))
+        if args.cuda:
+            inputs = inputs.cuda(non_blocking=True)
+
+        if self.nnet.training:
+            self.nnet.eval()
+        with torch.inference_mode():
+            if args.jit:
+                if self.traced is None:
+                    self.traced = torch.jit.trace(self.nnet, inputs, check_trace=False)
+                pi, v = self.traced(inputs)
+            else:
+                pi, v = self.nnet(inputs)
+
+        return torch.exp(pi).cpu().numpy(), v.cpu().numpy().reshape(batch_size)
+
+    def loss_pi(self, targets, outputs, weights=None):
+        losses = torch.sum(targets * outputs, 1)
+        if weights is not None:
+            losses = losses * weights
+        return -torch.sum(losses) / targets.size()[0]
+
+    def loss_v(self, targets, outputs, weights=None):
+        losses = (targets - outputs.view(-1)) ** 2
+        if weights is not None:
+            losses = losses * weights
+        return torch.sum(losses) / targets.size()[0]
+
+    def get_weights(self):
+        return {name: tensor.detach().cpu().numpy().copy() for name, tensor in self.nnet.state_dict().items()}
+
+    def set_weights(self, weights):
+        self.nnet.load_state_dict({name: torch.from_numpy(array) for name, array in weights.items()})
+        self.traced = None
 
     def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
         filepath = os.path.join(folder, filename)
@@ -118,3 +195,4 @@ class NNetWrapper(NeuralNet):
         map_location = None if args.cuda else 'cpu'
         checkpoint = torch.load(filepath, map_location=map_location)
         self.nnet.load_state_dict(checkpoint['state_dict'])
+        self.traced = None
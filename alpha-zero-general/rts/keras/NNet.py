@@ -5,6 +5,7 @@ import numpy as np
 
 sys.path.append('../..')
 from NeuralNet import NeuralNet
+from ExampleStream import ExampleStream
 from rts.keras.RTSNNet import RTSNNet
 from rts.src.config import VERBOSE_MODEL_FIT
 
@@ -43,17 +44,10 @@ class NNetWrapper(NeuralNet):
         """
         from rts.src.config_class import CONFIG
 
-        input_boards, target_pis, target_vs = list(zip(*examples))
-        input_boards = np.asarray(input_boards)
-        target_pis = np.asarray(target_pis)
-        target_vs = np.asarray(target_vs)
-
-        """
-        input_boards = CONFIG.nnet_args.encoder.encode_multiple(input_boards)
-        """
-        input_boards = self.encoder.encode_multiple(input_boards)
-
-        self.nnet.model.fit(x=input_boards, y=[target_pis, target_vs], batch_size=CONFIG.nnet_args.batch_size, epochs=CONFIG.nnet_args.epochs, verbose=VERBOSE_MODEL_FIT)
+        stream = ExampleStream(examples, action_size=self.action_size, batch_size=CONFIG.nnet_args.batch_size,
+                               transform=self.encoder.encode_multiple)
+        self.nnet.model.fit(stream.dataset(), steps_per_epoch=len(stream), epochs=CONFIG.nnet_args.epochs,
+                            shuffle=False, verbose=VERBOSE_MODEL_FIT)
 
     def predict(self, board, player=None):
         """
@@ -72,6 +66,12 @@ class NNetWrapper(NeuralNet):
         pi, v = self.nnet.model.predict(board, verbose=False)
         return pi[0], v[0]
 
+    def get_weights(self):
+        return self.nnet.model.get_weights()
+
+    def set_weights(self, weights):
+        self.nnet.model.set_weights(weights)
+
     def save_checkpoint(self, folder='checkpoint', filename='checkpoint.pth.tar'):
         # change extension
         filename = filename.split(".")[0] + ".h5"
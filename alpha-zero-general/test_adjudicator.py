@@ -0,0 +1,81 @@
+"""
+Unit tests for ending games that repeat positions or run too long.
+"""
+import unittest
+
+import numpy as np
+
+from Adjudicator import Adjudicator
+from Arena import Arena
+from Game import Game
+from NeuralNet import NeuralNet
+
+
+class ShuffleGame(Game):
+    """A game without an end in which both players move a piece back and forth."""
+
+    def getInitBoard(self):
+        return np.zeros(2, dtype=np.int8)
+
+    def getActionSize(self):
+        return 1
+
+    def getNextState(self, board, player, action):
+        board = board.copy()
+        board[0 if player == 1 else 1] ^= 1
+        return board, -player
+
+    def getValidMoves(self, board, player):
+        return np.ones(1)
+
+    def getGameEnded(self, board, player):
+        return 0
+
+    def getCanonicalForm(self, board, player):
+        return board if player == 1 else board[::-1].copy()
+
+    def stringRepresentation(self, board):
+        return board.tobytes()
+
+
+class ConstantNNet(NeuralNet):
+    def __init__(self, value):
+        self.value = value
+
+    def predict(self, board):
+        return np.ones(1), self.value
+
+
+class TestAdjudicator(unittest.TestCase):
+    def setUp(self):
+        self.game = ShuffleGame()
+
+    def play(self, adjudicator):
+        arena = Arena(lambda board: 0, lambda board: 0, self.game, adjudicator=adjudicator)
+        return arena.playGame()
+
+    def test_max_moves(self):
+        """A game is a draw after maxMoves moves."""
+        self.assertEqual(self.play(Adjudicator(self.game, maxMoves=10)), 0)
+
+    def test_repetition(self):
+        """A repeated position ends the game long before maxMoves."""
+        moves = []
+        adjudicator = Adjudicator(self.game, maxMoves=None, repetitions=3)
+        arena = Arena(lambda board: moves.append(1) or 0, lambda board: 0, self.game, adjudicator=adjudicator)
+        self.assertEqual(arena.playGame(), 0)
+        self.assertLess(len(moves), 10)
+
+    def test_value(self):
+        """The value rule gives the game to the player the network favours."""
+        # the game ends after 4 moves with player 1 to move
+        adjudicator = Adjudicator(self.game, maxMoves=4, rule='value', nnets=[ConstantNNet(0.9)])
+        self.assertEqual(self.play(adjudicator), 1)
+        adjudicator = Adjudicator(self.game, maxMoves=4, rule='value', nnets=[ConstantNNet(-0.9)])
+        self.assertEqual(self.play(adjudicator), -1)
+        adjudicator = Adjudicator(self.game, maxMoves=4, rule='value', nnets=[ConstantNNet(0.1)])
+        self.assertEqual(self.play(adjudicator), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+"""
+Unit tests for collecting the results of background evaluations.
+"""
+import unittest
+
+from BackgroundEvaluator import BackgroundEvaluator
+from utils import dotdict
+
+
+def finish(results, filename):
+    results.put((filename, {'checkpoint_0.pth.tar': 0.5}))
+
+
+def fail():
+    raise SystemExit(1)
+
+
+class TestBackgroundEvaluator(unittest.TestCase):
+    def setUp(self):
+        self.evaluator = BackgroundEvaluator(None, None, dotdict({}))
+        self.evaluator.candidate = 'checkpoint_1.pth.tar'
+
+    def start(self, target, args=()):
+        self.evaluator.process = self.evaluator.context.Process(target=target, args=args, daemon=True)
+        self.evaluator.process.start()
+
+    def test_result(self):
+        """A blocking poll returns the score of the finished evaluation."""
+        self.start(finish, (self.evaluator.results, 'checkpoint_1.pth.tar'))
+        self.assertEqual(self.evaluator.poll(block=True), ('checkpoint_1.pth.tar', 0.5))
+        self.assertEqual(self.evaluator.pool, ['checkpoint_1.pth.tar'])
+
+    def test_failure(self):
+        """A blocking poll raises instead of waiting forever when the evaluation process dies."""
+        self.start(fail)
+        with self.assertRaises(RuntimeError):
+            self.evaluator.poll(block=True)
+        self.assertIsNone(self.evaluator.poll())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Unit tests for running many MCTS searches with batched leaf evaluations.
+"""
+import unittest
+
+import numpy as np
+
+from Arena import Arena
+from GameCache import GameCache
+from MCTS import MCTS, runBatched
+from NeuralNet import NeuralNet
+from lkid.LKIDGame import LKIDGame
+from utils import dotdict
+
+
+class CountingNNet(NeuralNet):
+    """A deterministic network that records the sizes of its batches."""
+
+    def __init__(self, game):
+        self.action_size = game.getActionSize()
+        self.batch_sizes = []
+
+    def predict(self, board):
+        pis, vs = self.predict_batch(np.asarray(board)[np.newaxis])
+        return pis[0], vs[0]
+
+    def predict_batch(self, boards):
+        boards = np.asarray(boards, dtype=np.float64)
+        self.batch_sizes.append(len(boards))
+        pis = np.ones((len(boards), self.action_size)) / self.action_size
+        vs = np.tanh(boards.reshape(len(boards), -1).sum(axis=1) / 100)
+        return pis, vs
+
+    def train(self, examples):
+        pass
+
+
+class NewPlayer():
+    """Picklable player factory for playGamesParallel."""
+
+    def __call__(self):
+        game = LKIDGame()
+        return MCTS(game, CountingNNet(game), dotdict({'numMCTSSims': 2, 'cpuct': 1})).bestActionSteps
+
+
+class TestBatchedSearch(unittest.TestCase):
+    def setUp(self):
+        self.game = LKIDGame()
+        self.nnet = CountingNNet(self.game)
+        self.args = dotdict({'numMCTSSims': 10, 'cpuct': 1})
+
+    def test_same_as_sequential(self):
+        """Batched searches give the same policies as sequential ones."""
+        boards = [self.game.getInitBoard() for _ in range(4)]
+        expected = [MCTS(self.game, self.nnet, self.args).getActionProb(board) for board in boards]
+        self.nnet.batch_sizes = []
+        tasks = [MCTS(self.game, self.nnet, self.args).getActionProbSteps(board) for board in boards]
+        results = runBatched(tasks, batch_size=3)
+        for probs, expected_probs in zip(results, expected):
+            np.testing.assert_allclose(probs, expected_probs)
+        self.assertEqual(max(self.nnet.batch_sizes), 3)
+
+    def test_stop(self):
+        """Only stop ends the run early, whatever the progress callback returns."""
+        boards = [self.game.getInitBoard() for _ in range(4)]
+        tasks = [MCTS(self.game, self.nnet, self.args).getActionProbSteps(board) for board in boards]
+        results = runBatched(tasks, batch_size=1, callback=lambda i, result: True)
+        self.assertTrue(all(result is not None for result in results))
+
+        tasks = [MCTS(self.game, self.nnet, self.args).getActionProbSteps(board) for board in boards]
+        results = runBatched(tasks, batch_size=1, stop=lambda i, result: i == 1)
+        self.assertEqual([result is not None for result in results], [True, True, False, False])
+
+    def test_arena(self):
+        """playGamesBatched plays every game to the end and counts all of them."""
+        self.args.numMCTSSims = 2
+
+        def newPlayer():
+            return MCTS(self.game, self.nnet, self.args).bestActionSteps
+
+        arena = Arena(None, None, self.game)
+        oneWon, twoWon, draws = arena.playGamesBatched(4, 4, (newPlayer, newPlayer))
+        self.assertEqual(oneWon + twoWon + draws, 4)
+
+    def test_arena_cache(self):
+        """Repeated and cached games are not played again but still counted."""
+        self.args.numMCTSSims = 2
+        created = []
+
+        def newPlayer():
+            created.append(1)
+            return MCTS(self.game, self.nnet, self.args).bestActionSteps
+
+        cache = GameCache()
+        arena = Arena(None, None, self.game, cache=cache, playerKeys=('a', 'b'))
+        first = arena.playGamesBatched(20, 4, (newPlayer, newPlayer))
+        self.assertEqual(sum(first), 20)
+        played = len(created) // 2
+        self.assertLess(played, 20)
+        self.assertEqual(len(cache.results), played)
+
+        # the second match only plays the starts the first one did not draw
+        second = arena.playGamesBatched(20, 4, (newPlayer, newPlayer))
+        self.assertEqual(sum(second), 20)
+        self.assertEqual(len(created) // 2, len(cache.results))
+
+    def test_eval_cache(self):
+        """A new tree reuses the evaluations of earlier ones until the weights change."""
+        self.args['evalCacheSize'] = 1000
+        board = self.game.getInitBoard()
+        expected = MCTS(self.game, self.nnet, self.args).getActionProb(board)
+        evaluations = len(self.nnet.batch_sizes)
+        np.testing.assert_allclose(MCTS(self.game, self.nnet, self.args).getActionProb(board), expected)
+        self.assertEqual(len(self.nnet.batch_sizes), evaluations)
+
+        self.nnet.train([])
+        MCTS(self.game, self.nnet, self.args).getActionProb(board)
+        self.assertEqual(len(self.nnet.batch_sizes), 2 * evaluations)
+
+    def test_arena_parallel(self):
+        """playGamesParallel plays the games in worker processes."""
+        arena = Arena(None, None, self.game)
+        oneWon, twoWon, draws = arena.playGamesParallel(2, 2, (NewPlayer(), NewPlayer()))
+        self.assertEqual(oneWon + twoWon + draws, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
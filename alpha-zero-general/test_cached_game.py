@@ -0,0 +1,48 @@
+"""
+Unit tests for memoizing the rules of a game.
+"""
+import pickle
+import unittest
+
+import numpy as np
+
+from CachedGame import CachedGame
+from lkid.LKIDGame import LKIDGame
+
+
+class TestCachedGame(unittest.TestCase):
+    def setUp(self):
+        self.game = LKIDGame()
+        self.cached = CachedGame(self.game, 100)
+
+    def test_same_results(self):
+        """The cached rules agree with the game's and are computed once per position."""
+        board = self.game.getInitBoard()
+        for player in (1, -1):
+            for _ in range(2):
+                np.testing.assert_array_equal(self.cached.getValidMoves(board, player),
+                                              self.game.getValidMoves(board, player))
+                self.assertEqual(self.cached.getGameEnded(board, player), self.game.getGameEnded(board, player))
+        self.assertEqual((self.cached.cache.hits, self.cached.cache.misses), (4, 4))
+
+    def test_read_only(self):
+        """The shared valid moves cannot be changed by a caller."""
+        valids = self.cached.getValidMoves(self.game.getInitBoard(), 1)
+        with self.assertRaises(ValueError):
+            valids[0] = 1
+
+    def test_pass_through(self):
+        """Other functions and attributes are those of the wrapped game."""
+        self.assertEqual(self.cached.getActionSize(), self.game.getActionSize())
+        self.assertEqual(self.cached.n, self.game.n)
+
+    def test_pickle(self):
+        """A pickled copy, e.g. in a pool worker, starts with an empty cache."""
+        self.cached.getValidMoves(self.game.getInitBoard(), 1)
+        copy = pickle.loads(pickle.dumps(self.cached))
+        self.assertEqual(len(copy.cache), 0)
+        self.assertEqual(copy.cache.capacity, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Unit tests for weight snapshots and background checkpoint writes.
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from CheckpointWriter import CheckpointWriter
+from NeuralNet import NeuralNet, getModelVersion
+
+
+class ArrayNNet(NeuralNet):
+    """A network whose weights are one array, checkpointed under a derived name like the keras wrappers."""
+
+    def __init__(self, game=None):
+        self.weights = np.zeros(3)
+
+    def train(self, examples):
+        self.weights = self.weights + 1
+
+    def save_checkpoint(self, folder, filename):
+        np.save(os.path.join(folder, filename.split('.')[0] + '.weights.npy'), self.weights)
+
+    def load_checkpoint(self, folder, filename):
+        self.weights = np.load(os.path.join(folder, filename.split('.')[0] + '.weights.npy'))
+
+
+class TestCheckpointWriter(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_snapshot(self):
+        """A snapshot restores the weights it was taken of and changes the model version."""
+        nnet = ArrayNNet()
+        snapshot = nnet.get_weights()
+        nnet.train([])
+        version = getModelVersion(nnet)
+        nnet.set_weights(snapshot)
+        np.testing.assert_array_equal(nnet.weights, np.zeros(3))
+        self.assertNotEqual(getModelVersion(nnet), version)
+
+    def test_write(self):
+        """Saved checkpoints hold the weights at the time of the save and no temporary files remain."""
+        nnet = ArrayNNet()
+        writer = CheckpointWriter(None, ArrayNNet)
+        nnet.train([])
+        writer.save(nnet, self.folder.name, ['checkpoint_1.pth.tar', 'best.pth.tar'])
+        nnet.train([])
+        writer.close()
+
+        self.assertEqual(sorted(os.listdir(self.folder.name)), ['best.weights.npy', 'checkpoint_1.weights.npy'])
+        loaded = ArrayNNet()
+        loaded.load_checkpoint(self.folder.name, 'best.pth.tar')
+        np.testing.assert_array_equal(loaded.weights, np.ones(3))
+
+    def test_error(self):
+        """A failed write is raised by the next wait."""
+        writer = CheckpointWriter(None, ArrayNNet)
+        writer.save(ArrayNNet(), os.path.join(self.folder.name, 'missing'), ['best.pth.tar'])
+        with self.assertRaises(RuntimeError):
+            writer.wait()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Unit tests for the training loop of the Coach.
+"""
+import tempfile
+import unittest
+
+import numpy as np
+
+from Coach import Coach
+from NeuralNet import NeuralNet
+from lkid.LKIDGame import LKIDGame
+from utils import dotdict
+
+
+class UniformNNet(NeuralNet):
+    """A network with a uniform policy that counts its trainings."""
+
+    def __init__(self, game):
+        self.action_size = game.getActionSize()
+        self.trainings = 0
+
+    def predict(self, board):
+        return np.ones(self.action_size) / self.action_size, 0.
+
+    def train(self, examples):
+        self.trainings += 1
+
+    def get_weights(self):
+        return None
+
+    def set_weights(self, weights):
+        pass
+
+    def save_checkpoint(self, folder, filename):
+        pass
+
+    def load_checkpoint(self, folder, filename):
+        pass
+
+
+class TestCoach(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.game = LKIDGame()
+        self.nnet = UniformNNet(self.game)
+        self.args = dotdict({'numIters': 1, 'numEps': 2, 'tempThreshold': 3, 'updateThreshold': 0.55,
+                             'maxlenOfQueue': 100, 'numMCTSSims': 2, 'arenaCompare': 2, 'cpuct': 1,
+                             'checkpoint': self.folder.name, 'numItersForTrainExamplesHistory': 2})
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_no_recorded_moves(self):
+        """An iteration in which playout cap randomization recorded no move skips training and gating."""
+        self.args['fullSearchProb'] = 0.
+        coach = Coach(self.game, self.nnet, self.args)
+        coach.learn()
+        self.assertEqual(self.nnet.trainings, 0)
+        self.assertIsNone(coach.getTrainExamples())
+
+
+if __name__ == '__main__':
+    unittest.main()
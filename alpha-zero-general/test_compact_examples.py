@@ -0,0 +1,94 @@
+"""
+Unit tests for the CompactExamples training example storage.
+"""
+import pickle
+import unittest
+
+import numpy as np
+
+from CompactExamples import CompactExamples
+from lkid.LKIDGame import LKIDGame
+
+
+def make_examples(game, n, visited=5):
+    examples = []
+    board = game.getInitBoard()
+    for i in range(n):
+        pi = np.zeros(game.getActionSize())
+        pi[np.arange(i, i + visited)] = 1. / visited
+        examples.append((board, list(pi), (-1) ** i))
+    return examples
+
+
+class TestCompactExamples(unittest.TestCase):
+    def setUp(self):
+        self.game = LKIDGame()
+        self.examples = make_examples(self.game, 20)
+        self.compact = CompactExamples.fromExamples(self.examples, self.game.getActionSize())
+
+    def test_round_trip(self):
+        """Indexing returns the original examples with dense policies."""
+        self.assertEqual(self.compact.boards.dtype, np.uint8)
+        self.assertEqual(self.compact.actions.dtype, np.uint16)
+        for (board, pi, v), (c_board, c_pi, c_v) in zip(self.examples, self.compact):
+            np.testing.assert_array_equal(board, c_board)
+            np.testing.assert_allclose(pi, c_pi, atol=1e-3)
+            self.assertEqual(v, c_v)
+
+    def test_take_and_batch(self):
+        """take/tail/concatenate keep policies attached to their boards."""
+        indices = np.array([7, 3, 19])
+        taken = self.compact.take(indices)
+        boards, pis, vs = taken.batch(np.arange(3))
+        for row, i in enumerate(indices):
+            np.testing.assert_allclose(pis[row], self.examples[i][1], atol=1e-3)
+            self.assertEqual(vs[row], self.examples[i][2])
+
+        both = CompactExamples.concatenate([self.compact, taken])
+        self.assertEqual(len(both), 23)
+        np.testing.assert_array_equal(both.tail(3).batch(np.arange(3))[1], pis)
+
+    def test_aggregate(self):
+        """Identical boards are merged into weighted averages of their targets."""
+        other = self.game.getInitBoard()
+        while np.array_equal(other, self.examples[0][0]):
+            other = self.game.getInitBoard()
+        examples = self.examples[:3] + [(other, self.examples[3][1], 1)]
+        unique = CompactExamples.fromExamples(examples, self.game.getActionSize()).aggregate()
+        self.assertEqual(len(unique), 2)
+        self.assertEqual(sorted(unique.weights), [1, 3])
+
+        merged = int(np.argmax(unique.weights))
+        board, pi, v = unique[merged]
+        np.testing.assert_array_equal(board, self.examples[0][0])
+        np.testing.assert_allclose(pi, np.mean([e[1] for e in self.examples[:3]], axis=0), atol=1e-3)
+        self.assertAlmostEqual(v, 1. / 3, places=5)
+
+        # aggregating again keeps the weights
+        again = CompactExamples.concatenate([unique, unique]).aggregate()
+        np.testing.assert_allclose(again[merged][1], pi, atol=1e-3)
+        self.assertEqual(sorted(again.weights), [2, 6])
+
+    def test_with_targets(self):
+        """withTargets replaces the targets of some examples and keeps the others."""
+        policies = [(np.array([100, 200]), np.array([0.25, 0.75])), (np.array([300]), np.array([1.]))]
+        changed = self.compact.withTargets([11, 4], policies, values=[0.5, -0.5])
+        self.assertEqual(len(changed), len(self.compact))
+        for i in range(len(self.compact)):
+            board, pi, v = changed[i]
+            if i not in (4, 11):
+                np.testing.assert_allclose(pi, self.compact[i][1])
+                self.assertEqual(v, self.compact[i][2])
+        self.assertEqual(changed[11][1][200], 0.75)
+        self.assertEqual(changed[4][1][300], 1)
+        self.assertEqual((changed[11][2], changed[4][2]), (0.5, -0.5))
+
+    def test_size(self):
+        """The pickled compact form is much smaller than the dense examples."""
+        dense = len(pickle.dumps(self.examples))
+        compact = len(pickle.dumps(self.compact))
+        self.assertLess(compact * 100, dense)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+"""
+Unit tests for the Elo fit used by tournament.py.
+"""
+import unittest
+
+from Elo import fitElo
+
+
+class TestElo(unittest.TestCase):
+    def test_order(self):
+        """Stronger players get higher ratings, centered around 0."""
+        ratings = fitElo(['a', 'b', 'c'], [('a', 'b', 15, 5, 0), ('b', 'c', 12, 6, 2), ('a', 'c', 18, 2, 0)])
+        self.assertGreater(ratings['a'][0], ratings['b'][0])
+        self.assertGreater(ratings['b'][0], ratings['c'][0])
+        self.assertAlmostEqual(sum(elo for elo, _ in ratings.values()), 0, places=6)
+
+    def test_even(self):
+        """An even match gives equal ratings; more games narrow the interval."""
+        few = fitElo(['a', 'b'], [('a', 'b', 5, 5, 0)])
+        many = fitElo(['a', 'b'], [('a', 'b', 50, 50, 0)])
+        self.assertAlmostEqual(few['a'][0], 0, places=6)
+        self.assertLess(many['a'][1], few['a'][1])
+
+    def test_perfect_score(self):
+        """A player winning every game still gets a finite rating."""
+        ratings = fitElo(['a', 'b'], [('a', 'b', 10, 0, 0)])
+        self.assertGreater(ratings['a'][0], 0)
+        self.assertLess(ratings['a'][0], 10000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Unit tests for the ExampleStream training input pipeline.
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from CompactExamples import CompactExamples
+from ExampleStream import ExampleStream
+from ReplayStore import ReplayStore
+
+
+def make_examples(n, action_size=6):
+    examples = []
+    for i in range(n):
+        board = np.full((2, 2), i)
+        if i % 2:
+            pi = (np.array([i % action_size]), np.array([1.0]))
+        else:
+            pi = np.ones(action_size) / action_size
+        examples.append((board, pi, (-1) ** i))
+    return examples
+
+
+class TestExampleStream(unittest.TestCase):
+    def test_batches_cover_all_examples(self):
+        """One pass yields every example exactly once with dense policies."""
+        examples = make_examples(10)
+        stream = ExampleStream(examples, action_size=6, batch_size=4)
+        self.assertEqual(len(stream), 3)
+
+        batches = [batch for batch, _ in zip(stream, range(len(stream)))]
+        boards = np.concatenate([boards for boards, _ in batches])
+        pis = np.concatenate([pis for _, (pis, _) in batches])
+        self.assertEqual(sorted(boards[:, 0, 0]), list(range(10)))
+        np.testing.assert_allclose(pis.sum(axis=1), 1.0)
+        for board, pi in zip(boards, pis):
+            if board[0, 0] % 2:
+                self.assertEqual(pi[board[0, 0] % 6], 1.0)
+
+    def test_replay_store(self):
+        """The memory-mapped segments of a replay store are streamed one after the other."""
+        examples = [(board, pi if isinstance(pi, np.ndarray) else np.eye(6)[pi[0][0]], v)
+                    for board, pi, v in make_examples(7)]
+        store = ReplayStore(os.path.join(tempfile.mkdtemp(), 'replay'))
+        store.append(CompactExamples.fromExamples(examples[:5], 6))
+        store.append(CompactExamples.fromExamples(examples[5:], 6))
+
+        stream = ExampleStream.fromReplayStore(ReplayStore(store.folder), action_size=6, batch_size=4, shuffle=False)
+        self.assertEqual(len(stream), 3)
+        batches = [batch for batch, _ in zip(stream, range(len(stream)))]
+        self.assertEqual([len(boards) for boards, _, _ in batches], [4, 1, 2])
+        np.testing.assert_array_equal(np.concatenate([boards for boards, _, _ in batches])[:, 0, 0], range(7))
+
+    def test_empty(self):
+        """A stream without examples is an error instead of an endless loop."""
+        with self.assertRaises(ValueError):
+            ExampleStream([], action_size=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
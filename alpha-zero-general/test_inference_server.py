@@ -0,0 +1,59 @@
+"""
+Unit tests for the batched InferenceServer.
+"""
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from InferenceServer import InferenceServer
+from NeuralNet import NeuralNet
+
+
+class SumNNet(NeuralNet):
+    """A network whose value is the sum of the board times a loaded factor."""
+
+    def __init__(self, game):
+        self.factor = 1.
+
+    def predict_batch(self, boards):
+        boards = np.asarray(boards, dtype=np.float32)
+        vs = boards.reshape(len(boards), -1).sum(axis=1) * self.factor
+        return np.ones((len(boards), 3), dtype=np.float32) / 3, vs
+
+    def load_checkpoint(self, folder, filename):
+        self.factor = float(filename)
+
+
+class TestInferenceServer(unittest.TestCase):
+    def test_batched_requests(self):
+        """Concurrent clients get their own results back, in batches."""
+        folder = tempfile.mkdtemp()
+        results = {}
+        with InferenceServer(None, SumNNet, folder, '2', num_clients=4, max_wait=0.05) as server:
+            def run(i):
+                client = server.client(i)
+                results[i] = [client.predict(np.full((2, 2), i))[1] for _ in range(5)]
+
+            threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            server.load(folder, '3')
+            pis, vs = server.client(0).predict_batch(np.ones((2, 2, 2)))
+
+        for i in range(4):
+            self.assertEqual(results[i], [8. * i] * 5)
+        np.testing.assert_allclose(vs, [12., 12.])
+        self.assertEqual(pis.shape, (2, 3))
+        stats = server.stats
+        self.assertEqual(np.sum(stats['batch_sizes'] * np.arange(len(stats['batch_sizes']))), 22)
+        self.assertLess(np.sum(stats['batch_sizes']), 21)  # some requests were batched
+        self.assertEqual(np.sum(stats['latencies']), 21)
+
+
+if __name__ == '__main__':
+    unittest.main()
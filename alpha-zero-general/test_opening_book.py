@@ -0,0 +1,67 @@
+"""
+Unit tests for the opening book of deep searches.
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from MCTS import MCTS
+from NeuralNet import NeuralNet
+from OpeningBook import OpeningBook
+from lkid.LKIDGame5x5 import LKIDGame
+from utils import dotdict
+
+
+class UniformNNet(NeuralNet):
+    """A network with a uniform policy that counts its predictions."""
+
+    def __init__(self, game):
+        self.action_size = game.getActionSize()
+        self.calls = 0
+
+    def predict(self, board):
+        self.calls += 1
+        return np.ones(self.action_size) / self.action_size, 0.
+
+
+class TestOpeningBook(unittest.TestCase):
+    def setUp(self):
+        self.game = LKIDGame()
+        self.nnet = UniformNNet(self.game)
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'book.npz')
+        self.args = dotdict({'numMCTSSims': 5, 'cpuct': 1, 'openingBook': self.path})
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_build(self):
+        """The book covers every start position and the best moves after it, and survives saving."""
+        book = OpeningBook.build(self.game, self.nnet, self.args, plies=2, sims=20, width=2)
+        starts = self.game.getStartBoards()
+        for board in starts:
+            counts = book.lookup(self.game.getCanonicalForm(board, 1))
+            self.assertAlmostEqual(counts.sum(), 1, places=5)
+        self.assertGreater(len(book), len(starts))
+        self.assertLessEqual(len(book), 3 * len(starts))
+
+        book.save(self.path)
+        loaded = OpeningBook.load(self.game, self.path)
+        self.assertEqual(len(loaded), len(book))
+        board = self.game.getCanonicalForm(starts[0], 1)
+        np.testing.assert_allclose(loaded.lookup(board), book.lookup(board))
+
+    def test_mcts_uses_book(self):
+        """Book positions are answered without evaluating the network."""
+        OpeningBook.build(self.game, self.nnet, self.args, plies=1, sims=20).save(self.path)
+        board = self.game.getCanonicalForm(self.game.getStartBoards()[0], 1)
+        self.nnet.calls = 0
+        probs = MCTS(self.game, self.nnet, self.args).getActionProb(board)
+        self.assertEqual(self.nnet.calls, 0)
+        self.assertAlmostEqual(sum(probs), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
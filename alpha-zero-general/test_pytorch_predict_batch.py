@@ -0,0 +1,55 @@
+"""
+Unit tests for the batched inference of the pytorch wrappers.
+"""
+import unittest
+
+import numpy as np
+
+from othello.OthelloGame import OthelloGame
+from othello.pytorch import NNet as OthelloNNet
+from tafl.TaflGame import TaflGame
+from tafl.pytorch import NNet as TaflNNet
+
+
+class TestPredictBatch(unittest.TestCase):
+    def setUp(self):
+        self.wrappers = [(OthelloNNet, OthelloGame(6)), (TaflNNet, TaflGame('Brandubh'))]
+        self.saved = [dict(module.args) for module, _ in self.wrappers]
+        for module, _ in self.wrappers:
+            module.args['num_channels'] = 16
+
+    def tearDown(self):
+        for (module, _), saved in zip(self.wrappers, self.saved):
+            module.args.update(saved)
+
+    def check(self, jit):
+        for module, game in self.wrappers:
+            module.args['jit'] = jit
+            nnet = module.NNetWrapper(game)
+            board_x, board_y = game.getBoardSize()
+            # batches of growing and shrinking size reuse and regrow the input buffer
+            for batch_size in (3, 5, 2):
+                with self.subTest(game=type(game).__name__, jit=jit, batch_size=batch_size):
+                    boards = np.random.randint(-1, 2, size=(batch_size, board_x, board_y))
+                    pis, vs = nnet.predict_batch(boards)
+                    self.assertEqual(pis.shape, (batch_size, game.getActionSize()))
+                    self.assertEqual(vs.shape, (batch_size,))
+                    # compare with the plain network, one board at a time
+                    module.args['jit'] = False
+                    expected = [nnet.predict(board) for board in boards]
+                    module.args['jit'] = jit
+                    for pi, v, (expected_pi, expected_v) in zip(pis, vs, expected):
+                        np.testing.assert_allclose(pi, expected_pi, rtol=1e-4, atol=1e-6)
+                        np.testing.assert_allclose(v, expected_v, rtol=1e-4, atol=1e-6)
+
+    def test_same_as_predict(self):
+        """A batch gives the same results as predicting its boards one at a time."""
+        self.check(jit=False)
+
+    def test_jit(self):
+        """The traced network gives the same results for batches of any size."""
+        self.check(jit=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Unit tests for the preallocated ReplayBuffer.
+"""
+import unittest
+
+import numpy as np
+
+from CompactExamples import CompactExamples
+from ReplayBuffer import ReplayBuffer
+
+
+def make_compact(values, visited=2, action_size=10):
+    examples = []
+    for value in values:
+        pi = np.zeros(action_size)
+        pi[(value + np.arange(visited)) % action_size] = 1. / visited
+        examples.append((np.full(3, value), pi, value))
+    return CompactExamples.fromExamples(examples, action_size)
+
+
+class TestReplayBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = ReplayBuffer(5, (3,), np.uint8, 10, max_policy_entries=3)
+
+    def test_ring(self):
+        """Adding beyond capacity overwrites the oldest positions."""
+        self.buffer.add(make_compact([0, 1, 2]), age=1)
+        self.buffer.add(make_compact([3, 4, 5]), age=2)
+        self.assertEqual(len(self.buffer), 5)
+        boards, pis, vs = self.buffer.batch(np.arange(5))
+        np.testing.assert_array_equal(vs, [1, 2, 3, 4, 5])
+        np.testing.assert_array_equal(boards[:, 0], [1, 2, 3, 4, 5])
+        for v, pi in zip(vs, pis):
+            np.testing.assert_allclose(pi[(int(v) + np.arange(2)) % 10], 0.5)
+            self.assertAlmostEqual(pi.sum(), 1.)
+
+    def test_evict(self):
+        """evict drops positions of older iterations."""
+        self.buffer.add(make_compact([0, 1]), age=1)
+        self.buffer.add(make_compact([2]), age=2)
+        self.buffer.evict(2)
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(self.buffer[0][2], 2)
+
+    def test_widen(self):
+        """Policies with more entries than a row holds widen the rows and are kept whole."""
+        self.buffer.add(make_compact([0]), age=1)
+        pi = np.array([0.1, 0.4, 0.05, 0.3, 0.15] + [0] * 5)
+        self.buffer.add(CompactExamples.fromExamples([(np.zeros(3, dtype=int), pi, 1)], 10), age=1)
+        self.assertEqual(self.buffer.actions.shape[1], 5)
+        np.testing.assert_allclose(self.buffer[1][1], pi, atol=1e-3)
+        np.testing.assert_allclose(self.buffer[0][1][:2], 0.5)
+
+    def test_prioritized_sample(self):
+        """Prioritized sampling only returns positions with non-zero priority."""
+        self.buffer.add(make_compact([0, 1, 2, 3]), age=1)
+        slots = self.buffer.slots()
+        self.buffer.updatePriorities(slots, [0, 0, 1, 0])
+        sample = self.buffer.sample(20, prioritized=True)
+        self.assertEqual(len(sample), 20)
+        np.testing.assert_array_equal(sample.batch(np.arange(20))[2], 2)
+
+    def test_value_errors(self):
+        """Priorities follow the value errors of a prediction."""
+        self.buffer.add(make_compact([0, 1, 2, 3]), age=1)
+        slots = self.buffer.slots()
+        values = self.buffer.values[slots]
+        self.buffer.updateValueErrors(slots, values + [0, 0.5, 0, 1], epsilon=0)
+        np.testing.assert_allclose(self.buffer.priorities[slots], [0, 0.5, 0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
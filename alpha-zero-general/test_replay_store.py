@@ -0,0 +1,63 @@
+"""
+Unit tests for the segmented ReplayStore.
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from CompactExamples import CompactExamples
+from ReplayStore import ReplayStore
+
+
+def make_compact(n, value):
+    pi = np.zeros(10)
+    pi[[1, 4]] = 0.5
+    return CompactExamples.fromExamples([(np.full(3, value), pi, value) for _ in range(n)], 10)
+
+
+class TestReplayStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = os.path.join(tempfile.mkdtemp(), 'replay')
+
+    def test_append_and_reload(self):
+        """Segments survive a reload memory-mapped and in order."""
+        store = ReplayStore(self.folder)
+        self.assertFalse(store.exists())
+        store.append(make_compact(3, 1))
+        store.append(make_compact(2, 2))
+
+        history = ReplayStore(self.folder).load()
+        self.assertEqual([len(h) for h in history], [3, 2])
+        self.assertIsInstance(history[0].boards, np.memmap)
+        board, pi, v = history[1][0]
+        self.assertEqual(v, 2)
+        np.testing.assert_allclose(pi[[1, 4]], 0.5)
+
+    def test_window(self):
+        """keepLatest drops the oldest segments from disk, names are not reused."""
+        store = ReplayStore(self.folder)
+        for value in range(4):
+            store.append(make_compact(1, value))
+        store.keepLatest(2)
+        self.assertEqual(len(os.listdir(self.folder)), 3)  # 2 segments and the manifest
+
+        store = ReplayStore(self.folder)
+        store.append(make_compact(1, 4))
+        store.keepLatest(2)
+        self.assertEqual([h.values[0] for h in store.load()], [3, 4])
+
+    def test_replace(self):
+        """replace swaps a segment in the window for a new one."""
+        store = ReplayStore(self.folder)
+        for value in range(3):
+            store.append(make_compact(2, value))
+        replaced = store.replace(1, make_compact(2, 7))
+        self.assertIsInstance(replaced.boards, np.memmap)
+        self.assertEqual([h.values[0] for h in ReplayStore(self.folder).load()], [0, 7, 2])
+        self.assertEqual(len(os.listdir(self.folder)), 4)  # 3 segments and the manifest
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Unit tests for the resignation of self-play games.
+"""
+import unittest
+
+from Resignation import ResignGame, Resignation
+
+
+def playtest(values, winner):
+    """A finished playtest game with root values alternating between players 1 and -1."""
+    game = ResignGame(None, 2, True)
+    for i, value in enumerate(values):
+        game.observe(1 if i % 2 == 0 else -1, value)
+    game.finish(winner)
+    return game
+
+
+class TestResignation(unittest.TestCase):
+    def test_observe(self):
+        """A player resigns after its value was below the threshold in its last moves."""
+        game = ResignGame(-0.8, 2, False)
+        self.assertFalse(game.observe(1, -0.9))
+        self.assertFalse(game.observe(-1, 0.9))
+        self.assertFalse(game.observe(1, -0.7))
+        self.assertFalse(game.observe(-1, 0.9))
+        self.assertFalse(game.observe(1, -0.9))
+        self.assertFalse(game.observe(-1, 0.9))
+        self.assertTrue(game.observe(1, -0.95))
+        self.assertEqual(game.winner, -1)
+
+    def test_calibration(self):
+        """The threshold rises to the highest one without wrong resignations."""
+        resignation = Resignation(threshold=-0.9, moves=2, minGames=2, minResignations=5)
+        # player 1 is lost at -0.6, but recovers from -0.27
+        lost = playtest([-0.6, 0.6, -0.6, 0.6, -0.6], -1)
+        recovered = playtest([-0.27, 0.3, -0.27, 0.3, 0.5], 1)
+        resignation.update([lost, recovered] * 5)
+        self.assertAlmostEqual(resignation.threshold, -0.3)
+        self.assertEqual(resignation.falsePositives(resignation.threshold), (5, 0))
+
+    def test_no_evidence(self):
+        """Without enough would-be resignations the threshold is kept."""
+        resignation = Resignation(threshold=-0.9, moves=2, minGames=2, minResignations=5)
+        lost = playtest([-0.6, 0.6, -0.6, 0.6, -0.6], -1)
+        balanced = playtest([0.1, -0.1, 0.1, -0.1, 0.1], 0)
+        resignation.update([lost, balanced] * 2)
+        self.assertAlmostEqual(resignation.threshold, -0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+Unit tests for sharing network evaluations between processes.
+"""
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from NeuralNet import NeuralNet
+from SharedEvalTable import SharedCacheNNet, SharedEvalTable, boardHash
+
+ACTION_SIZE = 4
+
+
+class SumNNet(NeuralNet):
+    """A deterministic network that counts its predictions."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, board):
+        self.calls += 1
+        return np.full(ACTION_SIZE, 1 / ACTION_SIZE), np.tanh(np.sum(board))
+
+
+table = None  # the SharedEvalTable of a pool process
+
+
+def initWorker(shared):
+    global table
+    table = shared
+
+
+def evaluate(board):
+    nnet = SumNNet()
+    SharedCacheNNet(nnet, table, 7).predict(np.asarray(board))
+    return nnet.calls
+
+
+class TestSharedEvalTable(unittest.TestCase):
+    def test_get_put(self):
+        """Entries are found for their version only and replaced on collisions."""
+        with SharedEvalTable(ACTION_SIZE, 8) as table:
+            pi = np.array([0.1, 0.2, 0.3, 0.4])
+            self.assertIsNone(table.get(3, 1))
+            table.put(3, 1, pi, 0.5)
+            cached_pi, v = table.get(3, 1)
+            np.testing.assert_allclose(cached_pi, pi)
+            self.assertAlmostEqual(v, 0.5)
+            self.assertIsNone(table.get(3, 2))
+
+            table.put(11, 1, pi, -0.5)  # the same slot
+            self.assertIsNone(table.get(3, 1))
+            self.assertAlmostEqual(table.get(11, 1)[1], -0.5)
+            self.assertEqual(table.usage(1), 1)
+
+    def test_shared_between_processes(self):
+        """An evaluation made in one worker is not made again in another."""
+        boards = [[1, 0], [0, 1], [1, 1]]
+        with SharedEvalTable(ACTION_SIZE, 64) as shared:
+            with multiprocessing.get_context().Pool(2, initializer=initWorker, initargs=(shared,)) as pool:
+                self.assertEqual(sum(pool.map(evaluate, boards)), 3)
+                self.assertEqual(sum(pool.map(evaluate, boards)), 0)
+            self.assertEqual(shared.usage(7), 3)
+            self.assertIsNotNone(shared.get(boardHash(np.asarray(boards[0])), 7))
+
+    def test_predict_batch(self):
+        """Batches evaluate only the boards that are not in the table."""
+        with SharedEvalTable(ACTION_SIZE, 64) as table:
+            nnet = SumNNet()
+            cached = SharedCacheNNet(nnet, table, 1)
+            boards = np.array([[1, 0], [0, 1], [1, 1]])
+            cached.predict(boards[0])
+            pis, vs = cached.predict_batch(boards)
+            self.assertEqual(nnet.calls, 3)
+            np.testing.assert_allclose(vs, np.tanh(boards.sum(axis=1)), rtol=1e-6)
+            self.assertEqual(pis.shape, (3, ACTION_SIZE))
+
+
+if __name__ == '__main__':
+    unittest.main()
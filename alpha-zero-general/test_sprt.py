@@ -0,0 +1,29 @@
+"""
+Unit tests for the SPRT gating stopper.
+"""
+import unittest
+
+from SPRT import SPRT
+
+
+class TestSPRT(unittest.TestCase):
+    def test_curtailment(self):
+        """The match stops once the remaining games cannot change the decision."""
+        test = SPRT(0.55, 10, alpha=1e-9, beta=1e-9)
+        self.assertIsNone(test(3, 2, 0))
+        self.assertIn('accepted', test(6, 0, 0))  # 6 / 10 >= 0.55 even if the rest is lost
+        self.assertIn('rejected', test(0, 5, 0))  # 5 / 10 < 0.55 even if the rest is won
+
+    def test_sprt(self):
+        """Lopsided results stop the match long before its end."""
+        test = SPRT(0.55, 1000)
+        self.assertIsNone(test(2, 1, 0))
+        stops = [next(n for n in range(1000) if test(n, 0, 0)), next(n for n in range(1000) if test(0, n, 0))]
+        self.assertTrue(all(n < 20 for n in stops))
+        self.assertIn('SPRT accepted', test(stops[0], 0, 0))
+        self.assertIn('SPRT rejected', test(0, stops[1], 0))
+        self.assertIsNone(test(55, 45, 10))  # close to the threshold, keep playing
+
+
+if __name__ == '__main__':
+    unittest.main()
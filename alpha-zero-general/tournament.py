@@ -0,0 +1,204 @@
+"""
+Plays a round-robin or gauntlet tournament between LKID checkpoints and
+baseline players and rates them with Elo.
+
+Players are described in a JSON file with a list of objects like
+    {"name": "iter10", "type": "mcts", "checkpoint": "./temp/checkpoint_10.pth.tar", "sims": 50, "cpuct": 1.0}
+    {"name": "random", "type": "random"}
+    {"name": "greedy", "type": "greedy"}
+and checkpoints can also be added with --checkpoints, as mcts players named
+after their file.
+
+The results of every pairing are stored in the --results folder under the
+hashes of both player configs (which include the checkpoint contents), so a
+rerun only plays the games that are missing, e.g. those of a newly added
+checkpoint. Within a pairing, games between mcts players that repeat an
+earlier game (same start position and first mover) are not played again,
+see GameCache; --opening-moves random moves at the start make them differ.
+
+Example:
+    python tournament.py --players baselines.json --checkpoints temp/checkpoint_*.pth.tar --games 20 --workers 4
+"""
+import argparse
+import hashlib
+import importlib
+import itertools
+import json
+import os
+
+from Adjudicator import Adjudicator
+from Arena import Arena
+from CachedGame import CachedGame
+from Elo import fitElo
+from GameCache import GameCache, checkpointHash
+from MCTS import MCTS
+from utils import dotdict
+
+GAMES = {
+    'lkid': ('lkid.LKIDGame', 'LKIDGame'),
+    'lkid5x5': ('lkid.LKIDGame5x5', 'LKIDGame'),
+    'lkid5x5barriers': ('lkid.LKIDGame5x5Barriers', 'LKIDGame5x5Barriers'),
+}
+
+
+def loadGame(name, rulesCacheSize=None):
+    module, cls = GAMES[name]
+    game = getattr(importlib.import_module(module), cls)()
+    return CachedGame(game, rulesCacheSize) if rulesCacheSize else game
+
+
+class PlayerFactory():
+    """
+    Picklable player factory (see Arena.playGamesParallel) for a player
+    config. The network of an mcts player is loaded on the first call.
+    """
+
+    def __init__(self, gameName, config, rulesCacheSize=None):
+        self.gameName = gameName
+        self.config = config
+        self.rulesCacheSize = rulesCacheSize
+        self.game = None
+        self.nnet = None
+
+    def __getstate__(self):
+        return {'gameName': self.gameName, 'config': self.config, 'rulesCacheSize': self.rulesCacheSize,
+                'game': None, 'nnet': None}
+
+    def __call__(self):
+        if self.game is None:
+            self.game = loadGame(self.gameName, self.rulesCacheSize)
+        kind = self.config['type']
+        if kind == 'random':
+            from lkid.LKIDPlayers import RandomPlayer
+            return RandomPlayer(self.game).play
+        if kind == 'greedy':
+            from lkid.LKIDPlayers import GreedyLKIDPlayer
+            return GreedyLKIDPlayer(self.game).play
+        if kind != 'mcts':
+            raise ValueError(f'Unknown player type {kind}')
+        if self.nnet is None:
+            from lkid.keras.NNet import NNetWrapper
+            self.nnet = NNetWrapper(self.game)
+            folder, filename = os.path.split(self.config['checkpoint'])
+            self.nnet.load_checkpoint(folder=folder, filename=filename)
+        args = dotdict({'numMCTSSims': self.config.get('sims', 50), 'cpuct': self.config.get('cpuct', 1.0)})
+        return MCTS(self.game, self.nnet, args).bestActionSteps
+
+
+def configHash(config):
+    """
+    Returns a hash of a player config. For mcts players it also covers the
+    contents of the checkpoint files (all files of the checkpoint folder that
+    start with the checkpoint's base name), so overwritten checkpoints are
+    played again.
+    """
+    digest = hashlib.sha1(json.dumps(config, sort_keys=True).encode())
+    if config['type'] == 'mcts':
+        digest.update(checkpointHash(*os.path.split(config['checkpoint'])).encode())
+    return digest.hexdigest()[:16]
+
+
+def schedule(names, gauntlet):
+    """
+    Returns the pairings to play: all pairs of players, or, with gauntlet
+    players, every gauntlet player against every other player.
+    """
+    if not gauntlet:
+        return list(itertools.combinations(names, 2))
+    return [(a, b) for a in gauntlet for b in names if b != a and not (b in gauntlet and names.index(b) < names.index(a))]
+
+
+def loadPairing(folder, hashes):
+    """
+    Returns the stored (wins, draws) of a pairing of the players with hashes,
+    wins in the order of hashes.
+    """
+    path = os.path.join(folder, '_'.join(sorted(hashes)) + '.json')
+    if not os.path.isfile(path):
+        return [0, 0], 0
+    with open(path) as f:
+        data = json.load(f)
+    wins = dict(zip(data['hashes'], data['wins']))
+    return [wins[h] for h in hashes], data['draws']
+
+
+def savePairing(folder, hashes, names, wins, draws):
+    path = os.path.join(folder, '_'.join(sorted(hashes)) + '.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'hashes': hashes, 'names': names, 'wins': wins, 'draws': draws}, f)
+    os.replace(path + '.tmp', path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Round-robin or gauntlet tournament with Elo ratings.')
+    parser.add_argument('--game', choices=sorted(GAMES), default='lkid')
+    parser.add_argument('--players', help='JSON file with player configs')
+    parser.add_argument('--checkpoints', nargs='*', default=[], help='checkpoints to add as mcts players')
+    parser.add_argument('--sims', type=int, default=50, help='MCTS simulations of the --checkpoints players')
+    parser.add_argument('--gauntlet', nargs='*', default=[], help='play only these players against all others')
+    parser.add_argument('--games', type=int, default=20, help='games per pairing, half with each first mover')
+    parser.add_argument('--workers', type=int, default=1, help='processes playing the games of a pairing')
+    parser.add_argument('--batch-size', type=int, default=1, help='concurrent games per pairing with one worker')
+    parser.add_argument('--opening-moves', type=int, default=0, help='random moves at the start of every game pair')
+    parser.add_argument('--max-moves', type=int, default=500, help='moves after which a game is a draw')
+    parser.add_argument('--repetitions', type=int, help='occurrences of a position after which a game is a draw')
+    parser.add_argument('--rules-cache', type=int, help='positions whose valid moves and game ends are memoized')
+    parser.add_argument('--results', default='./tournament/', help='folder with the stored pairing results')
+    options = parser.parse_args()
+
+    configs = []
+    if options.players:
+        with open(options.players) as f:
+            configs = json.load(f)
+    for checkpoint in options.checkpoints:
+        name = os.path.basename(checkpoint).split('.')[0]
+        configs.append({'name': name, 'type': 'mcts', 'checkpoint': checkpoint, 'sims': options.sims})
+    names = [config['name'] for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError('Player names must be unique')
+    configs = dict(zip(names, configs))
+    hashes = {name: configHash(config) for name, config in configs.items()}
+
+    game = loadGame(options.game, options.rules_cache)
+    os.makedirs(options.results, exist_ok=True)
+    cache = GameCache(os.path.join(options.results, 'games.json'))
+    adjudicator = Adjudicator(game, maxMoves=options.max_moves, repetitions=options.repetitions)
+    limits = f'{options.max_moves}-{options.repetitions}'
+    pairings = []
+    for a, b in schedule(names, options.gauntlet):
+        wins, draws = loadPairing(options.results, [hashes[a], hashes[b]])
+        missing = options.games - sum(wins) - draws
+        if missing >= 2:
+            # only the games of mcts players are deterministic
+            playerKeys = [f'{hashes[name]}-{limits}' if configs[name]['type'] == 'mcts' else None for name in (a, b)]
+            arena = Arena(None, None, game, cache=cache, playerKeys=playerKeys, openingMoves=options.opening_moves,
+                          adjudicator=adjudicator)
+            factories = (PlayerFactory(options.game, configs[a], options.rules_cache),
+                         PlayerFactory(options.game, configs[b], options.rules_cache))
+            if options.workers > 1:
+                w1, w2, d = arena.playGamesParallel(missing, options.workers, factories)
+            else:
+                w1, w2, d = arena.playGamesBatched(missing, options.batch_size, factories)
+            wins, draws = [wins[0] + w1, wins[1] + w2], draws + d
+            savePairing(options.results, [hashes[a], hashes[b]], [a, b], wins, draws)
+        print(f'{a} - {b}: {wins[0]} - {wins[1]}, {draws} draws' + ('' if missing >= 2 else ' (stored)'))
+        pairings.append((a, b, wins[0], wins[1], draws))
+
+    ratings = fitElo(names, pairings)
+    games = {name: 0 for name in names}
+    scores = {name: 0. for name in names}
+    for a, b, w1, w2, d in pairings:
+        games[a] += w1 + w2 + d
+        games[b] += w1 + w2 + d
+        scores[a] += w1 + d / 2
+        scores[b] += w2 + d / 2
+
+    print(f'\n{"rank":>4} {"player":<24} {"elo":>7} {"95% ci":>8} {"games":>6} {"score":>6}')
+    for rank, name in enumerate(sorted(names, key=lambda name: -ratings[name][0]), 1):
+        elo, ci = ratings[name]
+        score = scores[name] / games[name] if games[name] else 0
+        print(f'{rank:>4} {name:<24} {elo:>7.0f} {"±" + format(ci, ".0f"):>8} {games[name]:>6} {score:>6.1%}')
+
+
+if __name__ == "__main__":
+    main()
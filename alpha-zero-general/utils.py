@@ -1,3 +1,7 @@
+import multiprocessing
+from collections import OrderedDict
+
+
 class AverageMeter(object):
     """From https://github.com/pytorch/examples/blob/master/imagenet/main.py"""
 
@@ -20,3 +24,65 @@ class AverageMeter(object):
 class dotdict(dict):
     def __getattr__(self, name):
         return self[name]
+
+
+def processContext(method=None):
+    """
+    Returns the multiprocessing context to start worker processes with:
+    method ('spawn', 'forkserver' or 'fork'), spawn if it is None. Forked
+    workers can deadlock once the parent has initialised the threads of the
+    deep learning framework (e.g. TensorFlow in save_checkpoint), so fork is
+    opt-in.
+    """
+    return multiprocessing.get_context(method or 'spawn')
+
+
+class LRUCache(object):
+    """
+    Dict-like cache that keeps the capacity most recently used entries and
+    counts its hits and misses.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return (f'{len(self)}/{self.capacity} entries, {self.hits} hits, {self.misses} misses '
+                f'({self.hitRate:.1%} hit rate)')
+
+    @property
+    def hitRate(self):
+        return self.hits / max(1, self.hits + self.misses)
+
+    def get(self, key):
+        """
+        Returns the value of key, or None if it is not cached.
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def resize(self, capacity):
+        self.capacity = capacity
+        while len(self.entries) > capacity:
+            self.entries.popitem(last=False)
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0